@@ -0,0 +1,49 @@
+"""add playlist song position
+
+Revision ID: 6934df329297
+Revises: 8f215a8316df
+Create Date: 2026-10-18 09:12:40.518207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6934df329297"
+down_revision = "8f215a8316df"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("playlist_songs", sa.Column("position", sa.Integer(), nullable=True))
+    # Existing playlists keep their previous (song id) order
+    op.execute(
+        """
+        UPDATE playlist_songs SET position = numbered.position
+        FROM (
+            SELECT playlist_id, song_id,
+                   ROW_NUMBER() OVER (PARTITION BY playlist_id ORDER BY song_id) AS position
+            FROM playlist_songs
+        ) AS numbered
+        WHERE playlist_songs.playlist_id = numbered.playlist_id
+          AND playlist_songs.song_id = numbered.song_id
+        """
+    )
+    op.alter_column("playlist_songs", "position", nullable=False)
+    # Ordered track listings, also covers lookups by playlist_id alone
+    op.create_index(
+        "ix_playlist_songs_playlist_id_position",
+        "playlist_songs",
+        ["playlist_id", "position"],
+    )
+    op.drop_index("ix_playlist_songs_playlist_id", table_name="playlist_songs")
+
+
+def downgrade():
+    op.create_index("ix_playlist_songs_playlist_id", "playlist_songs", ["playlist_id"])
+    op.drop_index(
+        "ix_playlist_songs_playlist_id_position", table_name="playlist_songs"
+    )
+    op.drop_column("playlist_songs", "position")
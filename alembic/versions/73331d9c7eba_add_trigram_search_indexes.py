@@ -0,0 +1,47 @@
+"""add trigram search indexes
+
+Revision ID: 73331d9c7eba
+Revises: 79220b92d800
+Create Date: 2026-10-18 07:31:46.027519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "73331d9c7eba"
+down_revision = "79220b92d800"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_songs_title_trgm",
+        "songs",
+        ["title"],
+        postgresql_using="gin",
+        postgresql_ops={"title": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_artists_name_trgm",
+        "artists",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_playlists_name_trgm",
+        "playlists",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("ix_playlists_name_trgm", table_name="playlists")
+    op.drop_index("ix_artists_name_trgm", table_name="artists")
+    op.drop_index("ix_songs_title_trgm", table_name="songs")
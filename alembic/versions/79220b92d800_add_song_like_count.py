@@ -0,0 +1,59 @@
+"""add song like_count
+
+Revision ID: 79220b92d800
+Revises: a227c87608b9
+Create Date: 2026-10-18 07:20:11.412085
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "79220b92d800"
+down_revision = "a227c87608b9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "songs",
+        sa.Column("like_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE songs SET like_count = counts.likes
+        FROM (SELECT song_id, count(*) AS likes FROM likes GROUP BY song_id) AS counts
+        WHERE songs.id = counts.song_id
+        """
+    )
+    # Keeps songs.like_count in sync for every insert/delete on likes,
+    # including rows removed by ON DELETE CASCADE from users
+    op.execute(
+        """
+        CREATE FUNCTION songs_like_count() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE songs SET like_count = like_count + 1 WHERE id = NEW.song_id;
+            ELSE
+                UPDATE songs SET like_count = like_count - 1 WHERE id = OLD.song_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER likes_like_count
+        AFTER INSERT OR DELETE ON likes
+        FOR EACH ROW EXECUTE PROCEDURE songs_like_count()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER likes_like_count ON likes")
+    op.execute("DROP FUNCTION songs_like_count()")
+    op.drop_column("songs", "like_count")
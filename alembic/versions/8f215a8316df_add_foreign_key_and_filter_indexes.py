@@ -0,0 +1,74 @@
+"""add foreign key and filter indexes
+
+Revision ID: 8f215a8316df
+Revises: 73331d9c7eba
+Create Date: 2026-10-18 07:44:52.913604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8f215a8316df"
+down_revision = "73331d9c7eba"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Duplicates carry their own likes and playlist entries, merging them is
+    # left to a person rather than picked here
+    duplicates = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT artist_id, title, count(*) FROM songs "
+                "GROUP BY artist_id, title HAVING count(*) > 1 "
+                "ORDER BY artist_id, title LIMIT 20"
+            )
+        )
+        .all()
+    )
+    if duplicates:
+        listed = "\n".join(
+            f"    artist_id {artist_id}, title {title!r}: {count} songs"
+            for artist_id, title, count in duplicates
+        )
+        raise RuntimeError(
+            "songs holds several songs with the same artist_id and title, rename "
+            "or delete all but one of each before upgrading (first 20):\n" + listed
+        )
+    # Duplicate check in create_song, also covers songs by artist_id
+    op.create_index(
+        "uq_songs_artist_id_title", "songs", ["artist_id", "title"], unique=True
+    )
+    # get_songs genre filter paged by id
+    op.create_index("ix_songs_genre_id_id", "songs", ["genre_id", "id"])
+    op.create_index("ix_songs_created_by", "songs", ["created_by"])
+    # likes PK leads with created_by, cascades and counts go by song_id
+    op.create_index("ix_likes_song_id", "likes", ["song_id"])
+    # playlist_songs PK leads with song_id, listings go by playlist_id
+    op.create_index("ix_playlist_songs_playlist_id", "playlist_songs", ["playlist_id"])
+    # Duplicate check in create_playlist, also covers playlists by created_by
+    op.create_index("ix_playlists_created_by_name", "playlists", ["created_by", "name"])
+    op.create_index(
+        "ix_playlists_public",
+        "playlists",
+        ["id"],
+        postgresql_where=sa.text("private = false"),
+    )
+    op.create_index("ix_artists_name", "artists", ["name"])
+    op.create_index("ix_artists_created_by", "artists", ["created_by"])
+
+
+def downgrade():
+    op.drop_index("ix_artists_created_by", table_name="artists")
+    op.drop_index("ix_artists_name", table_name="artists")
+    op.drop_index("ix_playlists_public", table_name="playlists")
+    op.drop_index("ix_playlists_created_by_name", table_name="playlists")
+    op.drop_index("ix_playlist_songs_playlist_id", table_name="playlist_songs")
+    op.drop_index("ix_likes_song_id", table_name="likes")
+    op.drop_index("ix_songs_created_by", table_name="songs")
+    op.drop_index("ix_songs_genre_id_id", table_name="songs")
+    op.drop_index("uq_songs_artist_id_title", table_name="songs")
@@ -0,0 +1,69 @@
+"""add like created_at and trending songs
+
+Revision ID: b5e4d1c2a9f3
+Revises: 6934df329297
+Create Date: 2026-10-18 11:05:12.734915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5e4d1c2a9f3"
+down_revision = "6934df329297"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing likes have no recorded time, they count as liked at migration time
+    op.add_column(
+        "likes",
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    op.create_index("ix_likes_created_at", "likes", ["created_at"])
+    # Like counts per song over each trending period, refreshed by app/trending.py.
+    # Every row carries the time of the refresh that built it
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW trending_songs AS
+        SELECT periods.period, likes.song_id, songs.genre_id,
+               count(*) AS likes, now() AS refreshed_at
+        FROM (
+            VALUES ('day', interval '1 day'),
+                   ('week', interval '7 days'),
+                   ('month', interval '30 days')
+        ) AS periods (period, span)
+        JOIN likes ON likes.created_at >= now() - periods.span
+        JOIN songs ON songs.id = likes.song_id
+        GROUP BY periods.period, likes.song_id, songs.genre_id
+        """
+    )
+    # Unique index required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index(
+        "ix_trending_songs_period_song_id",
+        "trending_songs",
+        ["period", "song_id"],
+        unique=True,
+    )
+    # Leaderboard pages read in index order, overall and per genre
+    op.execute(
+        "CREATE INDEX ix_trending_songs_period_likes "
+        "ON trending_songs (period, likes DESC, song_id)"
+    )
+    op.execute(
+        "CREATE INDEX ix_trending_songs_period_genre_id_likes "
+        "ON trending_songs (period, genre_id, likes DESC, song_id)"
+    )
+
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW trending_songs")
+    op.drop_index("ix_likes_created_at", table_name="likes")
+    op.drop_column("likes", "created_at")
@@ -0,0 +1,44 @@
+"""add song neighbors
+
+Revision ID: c3f7a2e81d04
+Revises: b5e4d1c2a9f3
+Create Date: 2026-10-18 12:31:48.205671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c3f7a2e81d04"
+down_revision = "b5e4d1c2a9f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "song_neighbors",
+        sa.Column("song_id", sa.Integer(), nullable=False),
+        sa.Column("neighbor_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["song_id"], ["songs.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("song_id", "neighbor_id"),
+    )
+    op.create_index(
+        "ix_song_neighbors_song_id_score", "song_neighbors", ["song_id", "score"]
+    )
+    op.create_index("ix_song_neighbors_neighbor_id", "song_neighbors", ["neighbor_id"])
+    op.create_table(
+        "song_interaction_state",
+        sa.Column("song_id", sa.Integer(), nullable=False),
+        sa.Column("signature", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("song_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("song_interaction_state")
+    op.drop_index("ix_song_neighbors_neighbor_id", table_name="song_neighbors")
+    op.drop_index("ix_song_neighbors_song_id_score", table_name="song_neighbors")
+    op.drop_table("song_neighbors")
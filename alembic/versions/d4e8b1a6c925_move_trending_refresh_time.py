@@ -0,0 +1,73 @@
+"""move trending refresh time out of trending_songs
+
+Revision ID: d4e8b1a6c925
+Revises: c3f7a2e81d04
+Create Date: 2026-10-18 15:42:07.118394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d4e8b1a6c925"
+down_revision = "c3f7a2e81d04"
+branch_labels = None
+depends_on = None
+
+VIEW_QUERY = """
+    SELECT periods.period, likes.song_id, songs.genre_id,
+           count(*) AS likes{refreshed_at}
+    FROM (
+        VALUES ('day', interval '1 day'),
+               ('week', interval '7 days'),
+               ('month', interval '30 days')
+    ) AS periods (period, span)
+    JOIN likes ON likes.created_at >= now() - periods.span
+    JOIN songs ON songs.id = likes.song_id
+    GROUP BY periods.period, likes.song_id, songs.genre_id
+"""
+
+
+def create_view(refreshed_at: str):
+    op.execute(
+        "CREATE MATERIALIZED VIEW trending_songs AS "
+        + VIEW_QUERY.format(refreshed_at=refreshed_at)
+    )
+    # Unique index required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index(
+        "ix_trending_songs_period_song_id",
+        "trending_songs",
+        ["period", "song_id"],
+        unique=True,
+    )
+    op.execute(
+        "CREATE INDEX ix_trending_songs_period_likes "
+        "ON trending_songs (period, likes DESC, song_id)"
+    )
+    op.execute(
+        "CREATE INDEX ix_trending_songs_period_genre_id_likes "
+        "ON trending_songs (period, genre_id, likes DESC, song_id)"
+    )
+
+
+def upgrade():
+    # A refresh time on every row made each concurrent refresh rewrite the whole
+    # view, unchanged counts now keep their rows
+    op.execute("DROP MATERIALIZED VIEW trending_songs")
+    create_view(refreshed_at="")
+    # Single row, written by the refresh in the same transaction
+    op.create_table(
+        "trending_refresh",
+        sa.Column("id", sa.Boolean(), server_default=sa.text("true"), nullable=False),
+        sa.Column("refreshed_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.CheckConstraint("id", name="ck_trending_refresh_single_row"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute("INSERT INTO trending_refresh (refreshed_at) VALUES (now())")
+
+
+def downgrade():
+    op.drop_table("trending_refresh")
+    op.execute("DROP MATERIALIZED VIEW trending_songs")
+    create_view(refreshed_at=", now() AS refreshed_at")
@@ -0,0 +1,60 @@
+"""make playlist song positions unique
+
+Revision ID: e7a3c5f19b42
+Revises: d4e8b1a6c925
+Create Date: 2026-10-18 18:05:31.274610
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e7a3c5f19b42"
+down_revision = "d4e8b1a6c925"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Concurrent adds could give two tracks the same position, those playlists
+    # are numbered again in their current (position, song id) order
+    op.execute(
+        """
+        UPDATE playlist_songs SET position = numbered.position
+        FROM (
+            SELECT playlist_id, song_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY playlist_id ORDER BY position, song_id
+                   ) AS position
+            FROM playlist_songs
+            WHERE playlist_id IN (
+                SELECT playlist_id FROM playlist_songs
+                GROUP BY playlist_id, position HAVING count(*) > 1
+            )
+        ) AS numbered
+        WHERE playlist_songs.playlist_id = numbered.playlist_id
+          AND playlist_songs.song_id = numbered.song_id
+        """
+    )
+    # Deferred so reordering can swap positions within one UPDATE, its index
+    # replaces ix_playlist_songs_playlist_id_position for ordered listings
+    op.create_unique_constraint(
+        "uq_playlist_songs_playlist_id_position",
+        "playlist_songs",
+        ["playlist_id", "position"],
+        deferrable=True,
+        initially="DEFERRED",
+    )
+    op.drop_index("ix_playlist_songs_playlist_id_position", table_name="playlist_songs")
+
+
+def downgrade():
+    op.create_index(
+        "ix_playlist_songs_playlist_id_position",
+        "playlist_songs",
+        ["playlist_id", "position"],
+    )
+    op.drop_constraint(
+        "uq_playlist_songs_playlist_id_position", "playlist_songs", type_="unique"
+    )
@@ -0,0 +1,239 @@
+import csv
+import json
+from collections import deque
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from typing import AsyncIterator, Optional
+from . import models, schemas, response_cache
+from .config import settings
+
+""" Streaming bulk song import shared by POST /songs/bulk and app.cli """
+
+FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-lines": "ndjson",
+}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Splits a stream of byte chunks into lines, newline kept, holding one partial line at most"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+
+def in_quoted_field(text: str, quoted: bool = False) -> bool:
+    """Whether a quoted CSV field is still open after text, which starts inside one when quoted"""
+    if not quoted and '"' not in text:
+        return False
+    field_start = not quoted
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quoted:
+            if char == '"':
+                if text.startswith('"', index + 1):
+                    index += 1
+                else:
+                    quoted = False
+        elif char == '"' and field_start:
+            quoted = True
+        field_start = not quoted and char == ","
+        index += 1
+    return quoted
+
+
+class LineFeed:
+    """Lines for one csv.reader, appended as they arrive from the stream"""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def iter_records(lines: AsyncIterator[bytes], format: str):
+    """
+    Yields (row number, record dict or error message) for each non blank row.
+    A CSV row spans lines while a quoted field is open, rows that cannot be
+    decoded or parsed come out as error messages
+    """
+    header = None
+    row = 0
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    # Whether the CSV row read so far ends inside a quoted field
+    quoted = False
+    async for line in lines:
+        try:
+            text = line.decode("utf-8-sig")
+        except UnicodeDecodeError as error:
+            # Drops the CSV row it belonged to, the next line starts a new one
+            feed.lines.clear()
+            quoted = False
+            row += 1
+            yield row, f"Unreadable {format} row: {error}"
+            continue
+        if not feed.lines and not text.strip():
+            continue
+
+        if format == "csv":
+            feed.lines.append(text)
+            quoted = in_quoted_field(text, quoted)
+            if quoted:
+                continue
+            if header is None:
+                header = [name.strip() for name in next(reader, [])]
+                feed.lines.clear()
+                continue
+        row += 1
+        try:
+            if format == "csv":
+                values = next(reader)
+                # Empty cells fall back to the schema defaults
+                record = {k: v for k, v in zip(header, values) if v != ""}
+            else:
+                record = json.loads(text)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+        except (ValueError, csv.Error) as error:
+            feed.lines.clear()
+            yield row, f"Unreadable {format} row: {error}"
+            continue
+        yield row, record
+
+    if feed.lines:
+        yield row + 1, f"Unreadable {format} row: unterminated quoted field"
+
+
+class SongImport:
+    """Validates and inserts songs in batches of settings.bulk_import_batch_size rows"""
+
+    def __init__(self, db, created_by: int):
+        self.db = db
+        self.created_by = created_by
+        self.batch = []
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row: int, detail: str):
+        self.failed += 1
+        if len(self.errors) < settings.bulk_import_max_errors:
+            self.errors.append({"row": row, "detail": detail})
+
+    async def add(self, row: int, record):
+        if isinstance(record, str):
+            return self.error(row, record)
+        try:
+            song = schemas.SongCreate(**record)
+        except ValidationError as error:
+            return self.error(
+                row,
+                "; ".join(
+                    f"{'.'.join(map(str, e['loc']))}: {e['msg']}"
+                    for e in error.errors()
+                ),
+            )
+        self.batch.append((row, song))
+        if len(self.batch) >= settings.bulk_import_batch_size:
+            await self.flush()
+
+    async def existing_ids(self, column, ids: set) -> set:
+        if not ids:
+            return set()
+        return set((await self.db.scalars(select(column).where(column.in_(ids)))).all())
+
+    async def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+
+        # One lookup per referenced table for the whole batch
+        artist_ids = await self.existing_ids(
+            models.Artist.id, {song.artist_id for _, song in batch}
+        )
+        genre_ids = await self.existing_ids(
+            models.Genre.id, {song.genre_id for _, song in batch}
+        )
+
+        rows = {}
+        for row, song in batch:
+            key = (song.artist_id, song.title)
+            if song.artist_id not in artist_ids:
+                self.error(row, f"Artist with id: {song.artist_id} not found")
+            elif song.genre_id not in genre_ids:
+                self.error(row, f"Genre id: {song.genre_id} not found")
+            elif key in rows:
+                self.error(row, f"Duplicate of row {rows[key][0]}")
+            else:
+                rows[key] = (row, song)
+        if not rows:
+            return
+
+        # Rows skipped by ON CONFLICT are missing from RETURNING
+        created = await self.db.execute(
+            insert(models.Song)
+            .values(
+                [
+                    dict(created_by=self.created_by, **song.dict())
+                    for _, song in rows.values()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["artist_id", "title"])
+            .returning(models.Song.artist_id, models.Song.title)
+        )
+        created = set(map(tuple, created.all()))
+        await self.db.commit()
+        await response_cache.invalidate(
+            *(f"artist:{artist_id}" for artist_id, _ in created)
+        )
+
+        self.inserted += len(created)
+        for key, (row, song) in rows.items():
+            if key not in created:
+                self.error(
+                    row,
+                    f"Artist with id: {song.artist_id} and song title: '{song.title}' already exists",
+                )
+
+    def report(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def import_songs(
+    db, chunks: AsyncIterator[bytes], format: str, created_by: int
+) -> dict:
+    """
+    Imports songs from a CSV (with a header row) or NDJSON byte stream, one record per row.
+    Each batch is committed on its own, rows already imported stay when a later one fails
+    """
+    song_import = SongImport(db, created_by)
+    async for row, record in iter_records(iter_lines(chunks), format):
+        await song_import.add(row, record)
+    await song_import.flush()
+    return song_import.report()
+
+
+def format_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return FORMATS.get(media_type)
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from .config import settings
+
+""" In-process and shared (Redis) caches """
+
+
+class TTLCache:
+    """Thread safe in-process LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBackend:
+    """Async cache interface over a TTLCache local to this worker process"""
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float):
+        self.namespace = namespace
+        self._cache = TTLCache(maxsize, ttl)
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def set(self, key, value, ttl: float = None):
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key):
+        self._cache.delete(key)
+
+
+class RedisBackend:
+    """Async cache interface shared by every worker through Redis, values are stored as JSON"""
+
+    def __init__(self, namespace: str, ttl: float, client):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._client = client
+
+    def _key(self, key) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key):
+        raw = await self._client.get(self._key(key))
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, value, ttl: float = None):
+        await self._client.set(
+            self._key(key),
+            json.dumps(value, default=str),
+            px=int((self.ttl if ttl is None else ttl) * 1000),
+        )
+
+    async def delete(self, key):
+        await self._client.delete(self._key(key))
+
+
+_redis_client = None
+
+
+def redis_client():
+    global _redis_client
+    if _redis_client is None:
+        if settings.cache_redis_url.startswith("fakeredis://"):
+            # In-process stand-in for tests, shares nothing between workers
+            import fakeredis.aioredis
+
+            _redis_client = fakeredis.aioredis.FakeRedis()
+        else:
+            # Optional dependency, only needed with cache_backend = "redis"
+            import redis.asyncio
+
+            _redis_client = redis.asyncio.from_url(settings.cache_redis_url)
+    return _redis_client
+
+
+def make_cache(namespace: str, maxsize: int, ttl: float):
+    """Returns the cache backend selected by settings.cache_backend"""
+    if settings.cache_backend == "redis":
+        return RedisBackend(namespace, ttl, redis_client())
+    return MemoryBackend(namespace, maxsize, ttl)
@@ -0,0 +1,98 @@
+"""
+Command line maintenance tasks
+
+    python -m app.cli import-songs catalog.ndjson --user-id 1 [--format csv]
+    python -m app.cli refresh-trending
+    python -m app.cli build-recommendations [--full] [--top-k 20]
+
+Runs against the database configured in .env, without going through the API.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from . import bulk_import, database, models, recommendations, trending
+
+CHUNK_SIZE = 1 << 16
+
+
+async def read_chunks(path: str):
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def import_songs(args) -> int:
+    format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    db = database.SyncSession(database.SessionLocal())
+    try:
+        if await db.get(models.User, args.user_id) is None:
+            print(f"User with id: {args.user_id} not found", file=sys.stderr)
+            return 1
+        report = await bulk_import.import_songs(
+            db, read_chunks(args.path), format, args.user_id
+        )
+    finally:
+        await db.close()
+    print(json.dumps(report, indent=2))
+    return 0 if report["failed"] == 0 else 2
+
+
+async def refresh_trending(args) -> int:
+    async with database.session_scope() as db:
+        if not await trending.refresh(db):
+            print("Another refresh of trending_songs is running", file=sys.stderr)
+            return 1
+    return 0
+
+
+async def build_recommendations(args) -> int:
+    with database.SessionLocal() as db:
+        report = recommendations.build(db, top_k=args.top_k, full=args.full)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    songs = commands.add_parser(
+        "import-songs", help="bulk import songs from a CSV or NDJSON file"
+    )
+    songs.add_argument("path")
+    songs.add_argument(
+        "--user-id", type=int, required=True, help="recorded as created_by"
+    )
+    songs.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="defaults to csv for .csv files, ndjson otherwise",
+    )
+    songs.set_defaults(func=import_songs)
+
+    refresh = commands.add_parser(
+        "refresh-trending", help="rebuild the trending_songs materialized view"
+    )
+    refresh.set_defaults(func=refresh_trending)
+
+    neighbors = commands.add_parser(
+        "build-recommendations",
+        help="update song_neighbors from likes and playlists, needs numpy and scipy",
+    )
+    neighbors.add_argument(
+        "--full", action="store_true", help="recompute every song, not only changes"
+    )
+    neighbors.add_argument(
+        "--top-k",
+        type=int,
+        help="neighbors kept per recomputed song, with --full for all",
+    )
+    neighbors.set_defaults(func=build_recommendations)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
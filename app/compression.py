@@ -0,0 +1,129 @@
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+""" gzip and brotli response compression, negotiated from Accept-Encoding """
+
+try:
+    # Optional dependency, without it only gzip is offered
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        flush = zlib.Z_SYNC_FLUSH if more else zlib.Z_FINISH
+        return self._compressor.compress(data) + self._compressor.flush(flush)
+
+
+class BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        if more:
+            # Flushed per chunk so streamed rows reach the client as they are sent
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings of an Accept-Encoding header, leaving out those with q=0"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00"):
+            continue
+        if coding.strip():
+            accepted.add(coding.strip())
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least minimum_size bytes with brotli when the client
+    accepts it and the brotli package is installed, else with gzip. Streamed
+    responses are compressed chunk by chunk whatever their size
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compressor(self, scope: Scope):
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return BrotliCompressor(self.brotli_quality)
+        if "gzip" in accepted:
+            return GzipCompressor(self.gzip_level)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        compressor = self.compressor(scope) if scope["type"] == "http" else None
+        if compressor is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(compressor, self.minimum_size, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """Holds back the response start until the first body chunk decides the encoding"""
+
+    def __init__(self, compressor, minimum_size: int, send: Send):
+        self.compressor = compressor
+        self.minimum_size = minimum_size
+        self._send = send
+        self.start: Message = None
+        # None until the first body chunk, then whether the body is compressed
+        self.compressing = None
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.compressing is None:
+            headers = MutableHeaders(raw=self.start["headers"])
+            self.compressing = "content-encoding" not in headers and (
+                more or len(body) >= self.minimum_size
+            )
+            if self.compressing:
+                body = self.compressor.compress(body, more)
+                headers["Content-Encoding"] = self.compressor.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+            elif "content-encoding" not in headers:
+                headers.add_vary_header("Accept-Encoding")
+            await self._send(self.start)
+        elif self.compressing:
+            body = self.compressor.compress(body, more)
+
+        await self._send(
+            {"type": "http.response.body", "body": body, "more_body": more}
+        )
@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response, status
+from starlette.datastructures import Headers
+from typing import Optional
+
+""" HTTP validators (ETag, Last-Modified) and 304 Not Modified short circuits """
+
+VALIDATOR_HEADERS = ("ETag", "Last-Modified")
+
+
+def validators(request: Request, state, last_modified: datetime = None) -> dict:
+    """
+    ETag over the path, query params and state (values that change whenever the
+    response does, e.g. updated_at and counts). Pass last_modified only when
+    every change to the response moves it forward
+    """
+    params = sorted(request.query_params.multi_items())
+    # Timestamps as epoch seconds, tzinfo reprs differ between database drivers
+    state = [v.timestamp() if isinstance(v, datetime) else v for v in state]
+    digest = hashlib.sha1(repr((request.url.path, params, state)).encode())
+    headers = {"ETag": f'W/"{digest.hexdigest()[:24]}"'}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            last_modified.astimezone(timezone.utc), usegmt=True
+        )
+    return headers
+
+
+def opaque_tag(etag: str) -> str:
+    # Weak comparison, W/"x" and "x" match
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(request: Request, headers) -> bool:
+    """Whether If-None-Match or If-Modified-Since of request match the validator headers"""
+    headers = Headers(headers) if isinstance(headers, dict) else headers
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = headers.get("etag")
+        tags = {opaque_tag(tag) for tag in if_none_match.split(",")}
+        return etag is not None and ("*" in tags or opaque_tag(etag) in tags)
+
+    # Only consulted without If-None-Match, RFC 9110 section 13.2.2
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("last-modified")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(
+            if_modified_since
+        )
+    except (TypeError, ValueError):
+        return False
+
+
+def not_modified(request: Request, headers) -> Optional[Response]:
+    """304 response when the request validators still match headers, else None"""
+    if not is_not_modified(request, headers):
+        return None
+    headers = Headers(headers) if isinstance(headers, dict) else headers
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={name: headers[name] for name in VALIDATOR_HEADERS if name in headers},
+    )
@@ -1,5 +1,6 @@
 from hashlib import algorithms_available
 from pydantic import BaseSettings
+from typing import List
 
 
 class Settings(BaseSettings):
@@ -11,6 +12,101 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    # Use AsyncSession on asyncpg instead of sync sessions in the threadpool
+    database_async: bool = False
+    # Connection pool per engine, per worker process
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: int = 30
+    database_pool_recycle: int = -1
+    database_pool_pre_ping: bool = False
+    # 0 disables the statement timeout
+    database_statement_timeout_ms: int = 0
+    # Connect through PgBouncer in transaction pooling mode
+    database_pgbouncer: bool = False
+    # Rows fetched per round trip by streamed responses
+    database_yield_per: int = 1000
+    # "memory" caches per worker process, "redis" shares entries between workers.
+    # Run more than one worker with redis, response cache invalidation only
+    # reaches every worker through it
+    cache_backend: str = "memory"
+    # "fakeredis://" runs an in-process stand-in for tests
+    cache_redis_url: str = "redis://localhost:6379/0"
+    # Authenticated user principals, keyed by user id
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: int = 60
+    # Build the current user from the JWT claims without a database lookup,
+    # deleted users then keep access until their token expires
+    auth_trust_token_claims: bool = False
+    # "jose" or "pyjwt", signs and verifies with settings.algorithm
+    jwt_backend: str = "jose"
+    # Verified tokens kept until their exp claim, keyed by a hash of the token
+    token_cache_size: int = 10000
+    # Responses of catalog read routes, 0 disables the response cache
+    response_cache_ttl_seconds: int = 30
+    response_cache_size: int = 10000
+    # bcrypt cost, stored hashes below it are upgraded on the next login
+    bcrypt_rounds: int = 12
+    # Worker processes for password hashing and how many calls may wait for one
+    password_hash_workers: int = 2
+    password_hash_queue_size: int = 32
+    # Songs validated and inserted per statement by the bulk import
+    bulk_import_batch_size: int = 1000
+    # Row errors listed in a bulk import report, the rest are only counted
+    bulk_import_max_errors: int = 1000
+    # Responses smaller than this go out uncompressed, 0 disables compression
+    compression_minimum_size: int = 500
+    gzip_level: int = 6
+    # brotli is used over gzip when the client accepts it and Brotli is installed
+    brotli_quality: int = 4
+
+    # Queue likes in process and write them in batches, each worker flushes its own.
+    # Only for a single worker: the 409/404 answers come from the taps of the
+    # worker handling the request, and taps not yet flushed are lost if the
+    # process is killed (a graceful shutdown flushes them)
+    like_write_behind: bool = False
+    like_flush_interval_ms: int = 200
+    # Rows per INSERT/DELETE statement, reaching it also triggers an early flush
+    like_flush_batch_size: int = 1000
+    # Pending likes held before a tap has to wait for a flush
+    like_buffer_max_size: int = 100000
+
+    # Seconds between refreshes of the trending_songs view, 0 leaves it to
+    # python -m app.cli refresh-trending run from cron
+    trending_refresh_seconds: int = 300
+
+    # Neighbors kept per song by python -m app.cli build-recommendations
+    recommendations_top_k: int = 20
+    # Weight of a playlist relative to a user's likes as evidence of similarity
+    recommendations_playlist_weight: float = 1.0
+    # Most recent likes of a user that recommendations are drawn from
+    recommendations_seed_likes: int = 200
+
+    # Log requests slower than this with their SQL, 0 disables the slow request log
+    slow_request_ms: int = 0
+    slow_request_max_statements: int = 50
+
+    # Profile requests with pyinstrument (pip install pyinstrument), when off the
+    # middleware is not added at all. Admins send X-Profile: 1 to profile a
+    # request, profiling_sample_rate profiles that fraction of every request.
+    # Only the event loop thread is sampled, database calls in the threadpool of
+    # sync mode show as awaits there and get a separate threadpool profile
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0
+    profiling_interval_ms: float = 1
+    # Where profiles go, the newest profiling_keep are kept
+    profiling_dir: str = "profiles"
+    profiling_keep: int = 100
+    profiling_max_statements: int = 200
+
+    # Serves the Prometheus metrics without authentication on this port, 0 for
+    # none. Bind metrics_host to a private interface, GET /metrics on the API
+    # needs an admin token. Under gunicorn the master serves it for all workers
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
+
+    # Users allowed on the /admin routes, e.g. ADMIN_EMAILS='["ops@example.com"]'
+    admin_emails: List[str] = []
 
     class Config:
         env_file = ".env"
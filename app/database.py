@@ -1,6 +1,13 @@
-from sqlalchemy import create_engine
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from starlette.concurrency import run_in_threadpool
+from . import instrumentation, metrics
 from .config import settings
 
 # import psycopg2
@@ -8,20 +15,246 @@ from .config import settings
 # import time
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+SQLALCHEMY_ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits and its occupancy"""
+
+    metrics_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.DB_POOL_CHECKOUT_SECONDS.labels(self.metrics_label).observe(seconds)
+            instrumentation.add_pool_wait(seconds)
+            metrics.pool_changed(self.metrics_label, self)
+
+    def _do_return_conn(self, conn):
+        try:
+            super()._do_return_conn(conn)
+        finally:
+            metrics.pool_changed(self.metrics_label, self)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def engine_options(async_driver: bool = False) -> dict:
+    """Keyword arguments for create_engine built from the database_* settings"""
+    connect_args = {}
+    options = {"pool_pre_ping": settings.database_pool_pre_ping}
+
+    if settings.database_pgbouncer:
+        # PgBouncer owns the pooling and may hand every transaction a different
+        # server connection, so keep no local pool and no prepared statements
+        options["poolclass"] = NullPool
+        if async_driver:
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+    else:
+        options.update(
+            poolclass=(
+                InstrumentedAsyncQueuePool if async_driver else InstrumentedQueuePool
+            ),
+            pool_size=settings.database_pool_size,
+            max_overflow=settings.database_max_overflow,
+            pool_timeout=settings.database_pool_timeout,
+            pool_recycle=settings.database_pool_recycle,
+        )
+        # PgBouncer rejects startup parameters, see set_statement_timeout instead
+        if settings.database_statement_timeout_ms:
+            timeout = str(settings.database_statement_timeout_ms)
+            if async_driver:
+                connect_args["server_settings"] = {"statement_timeout": timeout}
+            else:
+                connect_args["options"] = f"-c statement_timeout={timeout}"
+
+    options["connect_args"] = connect_args
+    return options
+
+
+# Created by init_engines, read them as database.engine etc. from other modules
+ENGINE_ATTRIBUTES = ("engine", "SessionLocal", "async_engine", "AsyncSessionLocal")
+
+
+def init_engines():
+    """
+    Creates the engines and session factories once per process. The app does it
+    on startup, after a pre-fork server forked the worker, so no pool is shared
+    between processes and importing the app never touches the database driver
+    """
+    global engine, SessionLocal, async_engine, AsyncSessionLocal
+    if "engine" in globals():
+        return
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options())
+
+    # Objects stay loaded after commit, async sessions cannot lazy load expired attributes
+    SessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+    )
+
+    if settings.database_async:
+        async_engine = create_async_engine(
+            SQLALCHEMY_ASYNC_DATABASE_URL, **engine_options(async_driver=True)
+        )
+        AsyncSessionLocal = sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            expire_on_commit=False,
+            bind=async_engine,
+            class_=AsyncSession,
+        )
+
+    instrumentation.instrument_engine(engine)
+    if settings.database_async:
+        instrumentation.instrument_engine(async_engine.sync_engine)
+
+    if not settings.database_pgbouncer:
+        metrics.track_pool("sync", engine.pool)
+        if settings.database_async:
+            metrics.track_pool("async", async_engine.pool)
+
+
+def __getattr__(name: str):
+    # Scripts and the CLI get the engines on first use, without an app startup
+    if name in ENGINE_ATTRIBUTES:
+        init_engines()
+        if name in globals():
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if settings.database_pgbouncer and settings.database_statement_timeout_ms:
+    # AsyncSession runs a sync Session underneath, so this covers both engines
+    @event.listens_for(Session, "after_begin")
+    def set_statement_timeout(session, transaction, connection):
+        connection.execute(
+            text(
+                f"SET LOCAL statement_timeout = {settings.database_statement_timeout_ms}"
+            )
+        )
+
 
 Base = declarative_base()
 
+# Set by profiling.ProfilingMiddleware while it profiles a request, run_sync runs
+# the calls of that request through it
+threadpool_profiles = ContextVar("threadpool_profiles", default=None)
+
+
+async def run_sync(func, *args, **kwargs):
+    """run_in_threadpool that records how long the call waited for a free thread"""
+    submitted = time.perf_counter()
+
+    def timed():
+        instrumentation.add_threadpool_wait(time.perf_counter() - submitted)
+        profiles = threadpool_profiles.get()
+        if profiles is not None:
+            return profiles.run(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    return await run_in_threadpool(timed)
+
+
+class SyncSession:
+    """
+    Exposes the AsyncSession methods used by the routers over a sync Session,
+    running each database call in the threadpool when database_async is off
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_sync(self.sync_session.execute, statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_sync(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_sync(self.sync_session.scalars, statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        result = await run_sync(
+            self.sync_session.execute,
+            statement,
+            params,
+            execution_options={"stream_results": True},
+            **kwargs,
+        )
+        return SyncStreamResult(result)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_sync(self.sync_session.get, entity, ident, **kwargs)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_sync(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance):
+        await run_sync(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        await run_sync(self.sync_session.flush, objects)
+
+    async def commit(self):
+        await run_sync(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_sync(self.sync_session.rollback)
+
+    async def close(self):
+        await run_sync(self.sync_session.close)
+
+
+class SyncStreamResult:
+    """Server side cursor result of a sync Session read in the threadpool, like AsyncResult"""
+
+    def __init__(self, result):
+        self.result = result
+
+    def keys(self):
+        return self.result.keys()
+
+    async def partitions(self, size=None):
+        partitions = self.result.partitions(size)
+        while True:
+            partition = await run_sync(next, partitions, None)
+            if partition is None:
+                return
+            yield partition
+
+
+@asynccontextmanager
+async def session_scope():
+    """Session of the configured kind, for work outside of a request"""
+    init_engines()
+    if settings.database_async:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SyncSession(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
 # Dependency for SQLAlchemy database connection
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with session_scope() as db:
         yield db
-    finally:
-        db.close()
 
 
 """ Deprecated: Database connection using psycopg2 replaced with SQLAlchemy """
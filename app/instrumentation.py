@@ -0,0 +1,171 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Optional
+from . import metrics
+
+"""
+Per request timings: route latency, SQL statements and database time,
+serialization, pool checkout and threadpool queue waits, recorded into
+the metrics module and an optional slow request log
+"""
+
+logger = logging.getLogger("app.slow_requests")
+
+_current: ContextVar[Optional["RequestStats"]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class RequestStats:
+    """Totals of one request, shared by every task and thread it runs in"""
+
+    def __init__(self, max_statements: int = 0):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.threadpool_wait_seconds = 0.0
+        # (seconds, SQL) of the first max_statements statements, for the slow log
+        self.max_statements = max_statements
+        self.sql = []
+
+
+def current() -> Optional[RequestStats]:
+    """Stats of the request being handled, None outside of one"""
+    return _current.get()
+
+
+def add_pool_wait(seconds: float):
+    stats = _current.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def add_threadpool_wait(seconds: float):
+    metrics.THREADPOOL_WAIT_SECONDS.observe(seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.threadpool_wait_seconds += seconds
+
+
+@contextmanager
+def serialization_timer():
+    """Counts the time of the block as serialization of the current request"""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization_seconds += time.perf_counter() - start
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None or not conn.info.get("query_start"):
+        return
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    stats.statements += 1
+    stats.db_seconds += seconds
+    if len(stats.sql) < stats.max_statements:
+        stats.sql.append((seconds, statement))
+
+
+def instrument_engine(engine):
+    """Counts statements and their time on engine, for sync or async_engine.sync_engine"""
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+class InstrumentationMiddleware:
+    """
+    Records every HTTP request under its route template, e.g. /songs/{id}, and
+    logs the requests slower than slow_request_ms with the SQL they issued
+    """
+
+    def __init__(
+        self, app: ASGIApp, slow_request_ms: int = 0, max_statements: int = 50
+    ):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+        self.max_statements = max_statements if slow_request_ms > 0 else 0
+        self._route_paths = None
+
+    def route_path(self, scope: Scope) -> str:
+        # Unmatched paths share one label, the raw path would be unbounded
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(self.max_statements)
+        token = _current.set(stats)
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - start
+            _current.reset(token)
+            self.record(scope, status_code, seconds, stats)
+
+    def record(self, scope: Scope, status_code: int, seconds: float, stats):
+        method, route = scope["method"], self.route_path(scope)
+        metrics.HTTP_REQUEST_SECONDS.labels(method, route, status_code).observe(seconds)
+        metrics.HTTP_REQUEST_SQL_STATEMENTS.labels(method, route).observe(
+            stats.statements
+        )
+        metrics.HTTP_REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+        metrics.HTTP_REQUEST_SERIALIZATION_SECONDS.labels(method, route).observe(
+            stats.serialization_seconds
+        )
+        metrics.HTTP_REQUEST_POOL_WAIT_SECONDS.labels(method, route).observe(
+            stats.pool_wait_seconds
+        )
+        metrics.HTTP_REQUEST_THREADPOOL_WAIT_SECONDS.labels(method, route).observe(
+            stats.threadpool_wait_seconds
+        )
+
+        if self.slow_request_ms <= 0 or seconds * 1000 < self.slow_request_ms:
+            return
+        lines = [
+            f"Slow request {method} {scope['path']} ({route}) {status_code} "
+            f"{seconds * 1000:.1f}ms: {stats.statements} statements "
+            f"db {stats.db_seconds * 1000:.1f}ms, "
+            f"serialization {stats.serialization_seconds * 1000:.1f}ms, "
+            f"pool wait {stats.pool_wait_seconds * 1000:.1f}ms, "
+            f"threadpool wait {stats.threadpool_wait_seconds * 1000:.1f}ms"
+        ]
+        lines.extend(
+            f"    {statement_seconds * 1000:8.1f}ms {' '.join(statement.split())}"
+            for statement_seconds, statement in stats.sql
+        )
+        if stats.statements > len(stats.sql):
+            lines.append(f"    ... {stats.statements - len(stats.sql)} more")
+        logger.warning("\n".join(lines))
@@ -0,0 +1,52 @@
+"""Interchangeable JWT implementations, selected with settings.jwt_backend"""
+
+
+class JoseBackend:
+    """python-jose, the default"""
+
+    def __init__(self, secret_key: str, algorithm: str):
+        from jose import JWTError, jwt
+
+        self._jwt = jwt
+        self.errors = (JWTError,)
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(claims, self.secret_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        return self._jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+
+
+class PyJWTBackend:
+    """PyJWT, adds the EdDSA and ES* algorithms through the cryptography package"""
+
+    def __init__(self, secret_key: str, algorithm: str):
+        import jwt
+
+        if algorithm not in jwt.algorithms.get_default_algorithms():
+            raise ValueError(f"Algorithm {algorithm} is not supported by PyJWT")
+        self._jwt = jwt
+        self.errors = (jwt.PyJWTError,)
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(claims, self.secret_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        return self._jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+
+
+BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend}
+
+
+def get_backend(name: str, secret_key: str, algorithm: str):
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown jwt_backend: {name}, expected one of {list(BACKENDS)}"
+        )
+    return backend(secret_key, algorithm)
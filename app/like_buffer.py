@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from sqlalchemy import Integer, column, delete, select, values
+from sqlalchemy.dialects.postgresql import insert
+from typing import Dict, Optional, Tuple
+from . import database, metrics, models, response_cache
+from .config import settings
+
+""" Write-behind likes: taps are queued in process and written in batches """
+
+logger = logging.getLogger(__name__)
+
+# (user id, song id) -> 1 liked, 0 unliked
+Key = Tuple[int, int]
+
+
+def pending_rows(keys):
+    return values(
+        column("created_by", Integer), column("song_id", Integer), name="pending"
+    ).data(list(keys))
+
+
+def insert_likes(keys):
+    """Idempotent, rows already present or of since deleted songs/users are skipped"""
+    pending = pending_rows(keys)
+    rows = (
+        select(pending.c.created_by, pending.c.song_id)
+        .join(models.Song, models.Song.id == pending.c.song_id)
+        .join(models.User, models.User.id == pending.c.created_by)
+    )
+    return (
+        insert(models.Like)
+        .from_select(["created_by", "song_id"], rows)
+        .on_conflict_do_nothing()
+    )
+
+
+def delete_likes(keys):
+    """Idempotent DELETE ... USING, missing rows are no-ops"""
+    pending = pending_rows(keys)
+    return (
+        delete(models.Like)
+        .where(
+            models.Like.created_by == pending.c.created_by,
+            models.Like.song_id == pending.c.song_id,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class LikeBuffer:
+    """
+    Latest like or unlike per user and song, a like followed by an unlike before
+    the flush cancels out. Routes read state() over the database so clients keep
+    the synchronous 409/404 answers
+    """
+
+    def __init__(self, batch_size: int, interval: float, max_size: int):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_size = max_size
+        self.pending: Dict[Key, int] = {}
+        # Taken by the running flush, still answers state() until committed
+        self.flushing: Dict[Key, int] = {}
+        # Made in start(), asyncio primitives bind to the running loop on python < 3.10
+        self._lock = None
+        self._full = None
+        self._task = None
+
+    def state(self, user_id: int, song_id: int) -> Optional[int]:
+        """1 or 0 while a like or unlike is unwritten, None when the database is current"""
+        key = (user_id, song_id)
+        return self.pending.get(key, self.flushing.get(key))
+
+    async def add(self, user_id: int, song_id: int, dir: int):
+        if len(self.pending) >= self.max_size:
+            await self.flush()
+        self.pending[(user_id, song_id)] = dir
+        metrics.LIKE_BUFFER_PENDING.set(len(self.pending))
+        if len(self.pending) >= self.batch_size and self._full is not None:
+            self._full.set()
+
+    async def flush(self) -> int:
+        """Writes everything pending in one transaction, returns the rows written"""
+        async with self._lock:
+            if not self.pending:
+                return 0
+            self.flushing, self.pending = self.pending, {}
+            metrics.LIKE_BUFFER_PENDING.set(0)
+            try:
+                await self.write(self.flushing)
+            except BaseException:
+                # Taps made during the flush are newer and win
+                self.pending = {**self.flushing, **self.pending}
+                metrics.LIKE_BUFFER_PENDING.set(len(self.pending))
+                raise
+            finally:
+                batch, self.flushing = self.flushing, {}
+
+        metrics.LIKE_FLUSH_ROWS.observe(len(batch))
+        await response_cache.invalidate(*{f"song:{song_id}" for _, song_id in batch})
+        return len(batch)
+
+    async def write(self, batch: Dict[Key, int]):
+        likes = [key for key, dir in batch.items() if dir == 1]
+        unlikes = [key for key, dir in batch.items() if dir == 0]
+        async with database.session_scope() as db:
+            for keys in chunks(likes, self.batch_size):
+                await db.execute(insert_likes(keys))
+            for keys in chunks(unlikes, self.batch_size):
+                await db.execute(delete_likes(keys))
+            await db.commit()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                metrics.LIKE_FLUSH_ERRORS.inc()
+                logger.exception("Like flush failed, retrying in the next interval")
+
+    def start(self):
+        if self._task is None:
+            self._lock = asyncio.Lock()
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stops the flush loop and writes what is left"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+
+def warn_if_per_worker(workers: int):
+    """
+    Each worker answers from its own unwritten taps, so a like and an unlike
+    handled by different workers before a flush get 404 or a second 201 instead
+    of the answers of a single process
+    """
+    if workers > 1 and settings.like_write_behind:
+        logger.warning(
+            f"Write-behind likes with {workers} workers, a user's taps that reach "
+            f"different workers within {settings.like_flush_interval_ms}ms can get "
+            f"404 or a duplicate 201 instead of 409, unset LIKE_WRITE_BEHIND or run "
+            f"one worker"
+        )
+
+
+buffer = LikeBuffer(
+    settings.like_flush_batch_size,
+    settings.like_flush_interval_ms / 1000,
+    settings.like_buffer_max_size,
+)
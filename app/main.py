@@ -1,11 +1,34 @@
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 # from . import models
 # from .database import engine
-from .routers import genre, like, playlist, user, artist, song, auth, playlist_songs
+from .routers import (
+    genre,
+    like,
+    playlist,
+    user,
+    artist,
+    song,
+    auth,
+    playlist_songs,
+    search,
+    metrics,
+    admin,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from .compression import CompressionMiddleware
+from .config import settings
+from .instrumentation import InstrumentationMiddleware
+from .pagination import NEXT_CURSOR_HEADER
+from .profiling import PROFILE_ID_HEADER, ProfilingMiddleware
+from .serialization import ORJSONResponse
+from . import database, utils, like_buffer, trending, response_cache
+from . import metrics as prometheus_metrics
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Used to auto create database tables, deprecated for alembic
 # models.Base.metadata.create_all(bind=engine)
@@ -18,6 +41,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", PROFILE_ID_HEADER],
+)
+
+if settings.compression_minimum_size > 0:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.gzip_level,
+        brotli_quality=settings.brotli_quality,
+    )
+
+# Inside the instrumentation, whose request stats collect the SQL of a profile
+if settings.profiling_enabled:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.profiling_dir,
+        sample_rate=settings.profiling_sample_rate,
+        interval_ms=settings.profiling_interval_ms,
+        max_statements=settings.profiling_max_statements,
+        keep=settings.profiling_keep,
+    )
+
+# Added last so it runs first and times the other middleware too
+app.add_middleware(
+    InstrumentationMiddleware,
+    slow_request_ms=settings.slow_request_ms,
+    max_statements=settings.slow_request_max_statements,
 )
 
 app.include_router(playlist.router)
@@ -28,8 +78,71 @@ app.include_router(auth.router)
 app.include_router(playlist_songs.router)
 app.include_router(like.router)
 app.include_router(genre.router)
+app.include_router(search.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+
+
+# First, the other startup handlers need the engines
+@app.on_event("startup")
+def create_engines():
+    database.init_engines()
+
+
+@app.on_event("startup")
+def check_workers():
+    # gunicorn checks its worker count and serves metrics_port once, see
+    # gunicorn.conf.py, uvicorn takes its default --workers from WEB_CONCURRENCY
+    if "gunicorn" in os.environ.get("SERVER_SOFTWARE", ""):
+        return
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    response_cache.warn_if_per_worker(workers)
+    like_buffer.warn_if_per_worker(workers)
+    prometheus_metrics.warn_if_per_worker(workers)
+    try:
+        prometheus_metrics.start_server()
+    except OSError:
+        # Taken by another worker, whose scrapes cover all of them in
+        # multiprocess mode
+        pass
+
+
+@app.on_event("startup")
+def start_like_buffer():
+    if settings.like_write_behind:
+        like_buffer.buffer.start()
+
+
+@app.on_event("startup")
+def start_trending_refresh():
+    trending.start()
+
+
+@app.on_event("shutdown")
+async def stop_trending_refresh():
+    await trending.stop()
+
+
+@app.on_event("shutdown")
+async def flush_like_buffer():
+    await like_buffer.buffer.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_hash_pool():
+    utils.shutdown_hash_pool()
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """Database pool exhausted for longer than database_pool_timeout"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database connection pool exhausted"},
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Hello World"}
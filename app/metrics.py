@@ -0,0 +1,156 @@
+import logging
+import os
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import multiprocess, start_http_server
+from .config import settings
+
+"""
+Prometheus metrics, exposed on GET /metrics to admins and on metrics_port
+
+Every worker process counts its own. With PROMETHEUS_MULTIPROC_DIR set before
+prometheus_client is imported, as gunicorn.conf.py does, workers write them to
+files in that directory and a scrape of any process sums up all of them
+"""
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS_DIR = "PROMETHEUS_MULTIPROC_DIR"
+
+# Labelled by engine: "sync" (psycopg2) or "async" (asyncpg)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+# Pools are per worker, summed over the live ones in multiprocess mode
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Connections the pool keeps open, excluding overflow",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Overflow connections open beyond pool_size, negative while below it",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+# Hit rate: rate(response_cache_requests_total{result="hit"}) / rate(response_cache_requests_total)
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Response cache lookups by cache tag and hit or miss",
+    ["tag", "result"],
+)
+
+# Per request, labelled by method and route template, see app/instrumentation.py
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements",
+    "SQL statements executed by one request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time one request spent executing SQL statements",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_SERIALIZATION_SECONDS = Histogram(
+    "http_request_serialization_seconds",
+    "Time one request spent validating and rendering its response body",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_POOL_WAIT_SECONDS = Histogram(
+    "http_request_pool_wait_seconds",
+    "Time one request waited to check database connections out of the pool",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_THREADPOOL_WAIT_SECONDS = Histogram(
+    "http_request_threadpool_wait_seconds",
+    "Time one request's sync database calls queued for a threadpool thread",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+THREADPOOL_WAIT_SECONDS = Histogram(
+    "threadpool_wait_seconds",
+    "Time a sync database call queued for a threadpool thread",
+    buckets=LATENCY_BUCKETS,
+)
+
+# Write-behind likes, see app/like_buffer.py
+LIKE_BUFFER_PENDING = Gauge(
+    "like_buffer_pending",
+    "Likes and unlikes waiting for the next flush",
+    multiprocess_mode="livesum",
+)
+LIKE_FLUSH_ROWS = Histogram(
+    "like_flush_rows",
+    "Likes and unlikes written by one flush, one commit each",
+    buckets=(1, 10, 100, 1000, 10000, 100000),
+)
+LIKE_FLUSH_ERRORS = Counter(
+    "like_flush_errors_total", "Failed flushes, their likes are retried"
+)
+
+
+def track_pool(label: str, pool):
+    """
+    Reports occupancy of a QueuePool, the database pool classes call pool_changed
+    on every checkout and return. A scrape may run in another process, so the
+    gauges hold values rather than read the pool
+    """
+    DB_POOL_SIZE.labels(label).set(pool.size())
+    pool_changed(label, pool)
+
+
+def pool_changed(label: str, pool):
+    DB_POOL_CHECKED_OUT.labels(label).set(pool.checkedout())
+    DB_POOL_OVERFLOW.labels(label).set(pool.overflow())
+
+
+def multiprocess_mode() -> bool:
+    return MULTIPROCESS_DIR in os.environ
+
+
+def registry() -> CollectorRegistry:
+    """What a scrape reports, the metrics of every worker in multiprocess mode"""
+    if not multiprocess_mode():
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def warn_if_per_worker(workers: int):
+    """Without multiprocess mode each scrape reports the worker that answered it"""
+    if workers > 1 and not multiprocess_mode():
+        logger.warning(
+            f"Prometheus metrics with {workers} workers and no {MULTIPROCESS_DIR}, "
+            f"every scrape reports only the worker that answered it, run under "
+            f"gunicorn.conf.py or set {MULTIPROCESS_DIR} to an empty directory"
+        )
+
+
+def start_server():
+    """Serves scrapes without authentication on settings.metrics_port, if set"""
+    if settings.metrics_port:
+        start_http_server(
+            settings.metrics_port, addr=settings.metrics_host, registry=registry()
+        )
@@ -1,5 +1,6 @@
 from .database import Base
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Time
+from sqlalchemy import BigInteger, Boolean, Column, Float, Integer, String, ForeignKey
+from sqlalchemy import Index, Time, UniqueConstraint
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql.expression import text
 from sqlalchemy.orm import relationship
@@ -23,6 +24,16 @@ class Playlist(Base):
     """Describes a Playlist table in db"""
 
     __tablename__ = "playlists"
+    __table_args__ = (
+        Index(
+            "ix_playlists_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index("ix_playlists_created_by_name", "created_by", "name"),
+        Index("ix_playlists_public", "id", postgresql_where=text("private = false")),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     private = Column(Boolean, server_default="True", nullable=False)
@@ -40,6 +51,16 @@ class Artist(Base):
     """Describes an Artists table in db"""
 
     __tablename__ = "artists"
+    __table_args__ = (
+        Index(
+            "ix_artists_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index("ix_artists_name", "name"),
+        Index("ix_artists_created_by", "created_by"),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     created_at = Column(
@@ -49,7 +70,8 @@ class Artist(Base):
     created_by = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
-    songs = relationship("Song")
+    # Never lazy loaded, routes pick selectinload/joinedload for their response model
+    songs = relationship("Song", lazy="raise")
 
 
 class Genre(Base):
@@ -64,6 +86,17 @@ class Song(Base):
     """Creates a Songs table in db"""
 
     __tablename__ = "songs"
+    __table_args__ = (
+        Index(
+            "ix_songs_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index("uq_songs_artist_id_title", "artist_id", "title", unique=True),
+        Index("ix_songs_genre_id_id", "genre_id", "id"),
+        Index("ix_songs_created_by", "created_by"),
+    )
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     length = Column(Time, nullable=True)
@@ -80,19 +113,33 @@ class Song(Base):
     created_by = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
-    playlist = relationship("PlaylistSongs")
+    # Maintained by the likes_like_count trigger on the likes table
+    like_count = Column(Integer, nullable=False, server_default="0")
+    playlist = relationship("PlaylistSongs", lazy="raise")
 
 
 class PlaylistSongs(Base):
     """Creates a many-to-many relationship for Songs in Playlists"""
 
     __tablename__ = "playlist_songs"
+    __table_args__ = (
+        # Deferred so a reorder can swap positions within one UPDATE
+        UniqueConstraint(
+            "playlist_id",
+            "position",
+            name="uq_playlist_songs_playlist_id_position",
+            deferrable=True,
+            initially="DEFERRED",
+        ),
+    )
     song_id = Column(
         Integer, ForeignKey("songs.id", ondelete="CASCADE"), primary_key=True
     )
     playlist_id = Column(
         Integer, ForeignKey("playlists.id", ondelete="CASCADE"), primary_key=True
     )
+    # Track order within the playlist, starts at 1 and may have gaps after removals
+    position = Column(Integer, nullable=False)
     created_by = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
@@ -102,9 +149,42 @@ class Like(Base):
     """Creates a table for User to like song"""
 
     __tablename__ = "likes"
+    __table_args__ = (
+        Index("ix_likes_song_id", "song_id"),
+        Index("ix_likes_created_at", "created_at"),
+    )
     created_by = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
     )
     song_id = Column(
         Integer, ForeignKey("songs.id", ondelete="CASCADE"), primary_key=True
     )
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()")
+    )
+
+
+class SongNeighbor(Base):
+    """Most similar songs of each song, written by python -m app.cli build-recommendations"""
+
+    __tablename__ = "song_neighbors"
+    __table_args__ = (
+        Index("ix_song_neighbors_song_id_score", "song_id", "score"),
+        Index("ix_song_neighbors_neighbor_id", "neighbor_id"),
+    )
+    song_id = Column(
+        Integer, ForeignKey("songs.id", ondelete="CASCADE"), primary_key=True
+    )
+    # No foreign key, rows of deleted neighbors stay until the next build replaces
+    # them, reads join songs and skip them
+    neighbor_id = Column(Integer, primary_key=True)
+    score = Column(Float, nullable=False)
+
+
+class SongInteractionState(Base):
+    """Signature of the likes and playlists of a song at the last recommendations build"""
+
+    __tablename__ = "song_interaction_state"
+    # No foreign key, the next build sees deleted songs as changed and drops them
+    song_id = Column(Integer, primary_key=True)
+    signature = Column(BigInteger, nullable=False)
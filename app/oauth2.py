@@ -1,9 +1,11 @@
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from . import schemas, database, models
-from sqlalchemy.orm import Session
+import hashlib
+import time
+from . import schemas, database, models, cache, jwt_backends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -12,39 +14,91 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+jwt_backend = jwt_backends.get_backend(settings.jwt_backend, SECRET_KEY, ALGORITHM)
+
+# TokenData of verified tokens keyed by the sha256 digest of the token
+token_cache = cache.TTLCache(settings.token_cache_size, ttl=0)
+
+# Principals of authenticated users as {"id", "email"} dicts keyed by user id
+user_cache = cache.make_cache(
+    "users", settings.user_cache_size, settings.user_cache_ttl_seconds
+)
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_backend.encode(to_encode)
     return encoded_jwt
 
 
 def verify_access_token(token: str, credentials_exception):
+    token_key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(token_key)
+    if token_data is not None:
+        return token_data
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        id: str = payload.get("user_id")
+        payload = jwt_backend.decode(token)
+        id: int = payload.get("user_id")
         username: str = payload.get("username")
 
         if id is None:
             raise credentials_exception
         token_data = schemas.TokenData(id=id, username=username)
 
-    except JWTError:
+    except jwt_backend.errors:
         raise credentials_exception
 
+    # The signature and exp were just checked, skip both until the token expires
+    expires_in = payload.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(token_key, token_data, ttl=expires_in)
     return token_data
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)
-):
-    credentials_exception = HTTPException(
+def get_credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail=f"Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    token = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
-    return user
+
+
+def get_current_user_claims(token: str = Depends(oauth2_scheme)):
+    """Current user built from the token claims alone, without a database lookup"""
+    token = verify_access_token(token, get_credentials_exception())
+    return schemas.CurrentUser(id=token.id, email=token.username)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)
+):
+    if settings.auth_trust_token_claims:
+        return get_current_user_claims(token)
+
+    token = verify_access_token(token, get_credentials_exception())
+    principal = await user_cache.get(token.id)
+    if principal is None:
+        user = await db.scalar(select(models.User).where(models.User.id == token.id))
+        if user is None:
+            raise get_credentials_exception()
+        principal = {"id": user.id, "email": user.email}
+        await user_cache.set(token.id, principal)
+    return schemas.CurrentUser(**principal)
+
+
+async def invalidate_user(user_id: int):
+    """Drops a cached principal, call after deleting a user or changing a password"""
+    await user_cache.delete(user_id)
+
+
+async def get_admin_user(current_user=Depends(get_current_user)):
+    """Current user, if listed in settings.admin_emails"""
+    if current_user.email not in settings.admin_emails:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not authorized to perform requested action",
+        )
+    return current_user
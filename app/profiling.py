@@ -0,0 +1,198 @@
+import os
+import random
+import threading
+import time
+import uuid
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from . import database, instrumentation, oauth2
+from .config import settings
+
+"""
+On demand pyinstrument profiles of single requests, saved as a speedscope
+flame graph (open at https://www.speedscope.app) and a text report with the
+SQL the request issued. Only added to the app when profiling_enabled is set
+
+pyinstrument samples the thread it was started in, the event loop, where a
+database call of sync mode (database_async off) is one await on the threadpool.
+Those calls, made through database.run_sync, get a profile of their own on their
+thread, saved next to the request's as a combined threadpool profile
+"""
+
+# Sent as 1 by an admin to profile the request
+PROFILE_HEADER = "X-Profile"
+# Name of the saved profile, set on profiled responses
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+def is_admin_token(authorization: str) -> bool:
+    """
+    Whether an Authorization header carries a valid token of an admin. Trusts the
+    token claims, a deleted admin can profile until the token expires
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        claims = oauth2.verify_access_token(token, oauth2.get_credentials_exception())
+    except HTTPException:
+        return False
+    return claims.username in settings.admin_emails
+
+
+class ThreadpoolProfiles:
+    """Profiles of the threadpool calls of one request, combined into one session"""
+
+    def __init__(self, profiler_class, interval: float):
+        self.profiler_class = profiler_class
+        self.interval = interval
+        self.session = None
+        self._lock = threading.Lock()
+
+    def run(self, func, *args, **kwargs):
+        from pyinstrument.session import Session
+
+        profiler = self.profiler_class(interval=self.interval, async_mode="disabled")
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            session = profiler.stop()
+            with self._lock:
+                self.session = (
+                    session
+                    if self.session is None
+                    else Session.combine(self.session, session)
+                )
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests sent with X-Profile: 1 by an admin, and a sample_rate
+    fraction of all requests, one at a time per process, into directory
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        directory: str,
+        sample_rate: float = 0.0,
+        interval_ms: float = 1,
+        max_statements: int = 200,
+        keep: int = 100,
+    ):
+        # Optional dependency, only needed when profiling is enabled
+        from pyinstrument import Profiler
+
+        self.app = app
+        self.profiler_class = Profiler
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.max_statements = max_statements
+        self.keep = keep
+        # pyinstrument profiles one request per thread, and the event loop is one
+        self._active = False
+
+    def wanted(self, scope: Scope) -> bool:
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        headers = Headers(scope=scope)
+        return headers.get(PROFILE_HEADER) == "1" and is_admin_token(
+            headers.get("authorization")
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self._active or not self.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        # Keeps the SQL of this request, see instrumentation.after_cursor_execute
+        stats = instrumentation.current()
+        if stats is not None:
+            stats.max_statements = max(stats.max_statements, self.max_statements)
+
+        profiler = self.profiler_class(interval=self.interval, async_mode="enabled")
+        threadpool = ThreadpoolProfiles(self.profiler_class, self.interval)
+        token = database.threadpool_profiles.set(threadpool)
+        self._active = True
+        profiler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            seconds = time.perf_counter() - start
+            profiler.stop()
+            self._active = False
+            database.threadpool_profiles.reset(token)
+            await run_in_threadpool(
+                self.save, profile_id, scope, profiler, threadpool, stats, seconds
+            )
+
+    def save(
+        self,
+        profile_id: str,
+        scope: Scope,
+        profiler,
+        threadpool: ThreadpoolProfiles,
+        stats,
+        seconds: float,
+    ):
+        from pyinstrument.renderers import ConsoleRenderer, SpeedscopeRenderer
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id)
+        with open(path + ".speedscope.json", "w") as file:
+            file.write(profiler.output(SpeedscopeRenderer()))
+        if threadpool.session is not None:
+            with open(path + ".threadpool.speedscope.json", "w") as file:
+                file.write(SpeedscopeRenderer().render(threadpool.session))
+
+        query = scope["query_string"].decode("latin-1")
+        lines = [
+            f"{scope['method']} {scope['path']}{'?' + query if query else ''} "
+            f"{seconds * 1000:.1f}ms"
+        ]
+        if stats is not None:
+            lines.append(
+                f"{stats.statements} statements, db {stats.db_seconds * 1000:.1f}ms, "
+                f"serialization {stats.serialization_seconds * 1000:.1f}ms, "
+                f"pool wait {stats.pool_wait_seconds * 1000:.1f}ms, "
+                f"threadpool wait {stats.threadpool_wait_seconds * 1000:.1f}ms"
+            )
+            lines.extend(
+                f"    {statement_seconds * 1000:8.1f}ms {' '.join(statement.split())}"
+                for statement_seconds, statement in stats.sql
+            )
+            if stats.statements > len(stats.sql):
+                lines.append(f"    ... {stats.statements - len(stats.sql)} more")
+        lines.append(profiler.output_text(unicode=True, color=False))
+        if threadpool.session is not None:
+            lines.append("threadpool calls")
+            lines.append(
+                ConsoleRenderer(unicode=True, color=False).render(threadpool.session)
+            )
+        with open(path + ".txt", "w") as file:
+            file.write("\n".join(lines))
+        self.prune()
+
+    def prune(self):
+        """Deletes all but the newest keep profiles, ids sort by time"""
+        profile_ids = sorted(
+            {name.split(".")[0] for name in os.listdir(self.directory)}
+        )
+        for profile_id in profile_ids[: max(0, len(profile_ids) - self.keep)]:
+            for suffix in (".speedscope.json", ".threadpool.speedscope.json", ".txt"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,214 @@
+import hashlib
+from sqlalchemy import Float, Integer, column, delete, select, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List
+from . import models
+from .config import settings
+
+"""
+Item to item song similarity from the likes and playlist_songs tables, built
+offline into song_neighbors by python -m app.cli build-recommendations
+
+Each user's likes and each playlist is a basket, songs are similar when they
+share baskets (cosine over basket columns). Builds are incremental: only songs
+whose baskets changed since the last build, and the songs they share baskets
+or neighbors with, get their neighbors recomputed, from the baskets those songs
+are in. Finding the changes still reads every like and playlist song, there is
+no change log to read them from
+"""
+
+# Rows per statement when writing neighbors and state
+WRITE_BATCH_SIZE = 5000
+# Songs per sparse product, bounds the memory of one similarity block
+SIMILARITY_BLOCK_SIZE = 1000
+
+
+def chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def load_interactions(db: Session):
+    """
+    (basket codes, song ids, weights) arrays, a user's likes are basket 2 * user id
+    and a playlist is basket 2 * playlist id + 1, stable across builds
+    """
+    import numpy as np
+
+    baskets, songs, weights = [], [], []
+    sources = [
+        (select(models.Like.created_by, models.Like.song_id), 0, 1.0),
+        (
+            select(models.PlaylistSongs.playlist_id, models.PlaylistSongs.song_id),
+            1,
+            settings.recommendations_playlist_weight,
+        ),
+    ]
+    for query, kind, weight in sources:
+        result = db.execute(
+            query.execution_options(yield_per=settings.database_yield_per)
+        )
+        for partition in result.partitions():
+            for basket, song_id in partition:
+                baskets.append(basket * 2 + kind)
+                songs.append(song_id)
+                weights.append(weight)
+    return (
+        np.array(baskets, dtype=np.int64),
+        np.array(songs, dtype=np.int64),
+        np.array(weights, dtype=np.float64),
+    )
+
+
+def signatures(baskets, songs) -> Dict[int, int]:
+    """Hash of the sorted basket codes of every song, as a signed 64 bit integer"""
+    import numpy as np
+
+    if not len(songs):
+        return {}
+    order = np.lexsort((baskets, songs))
+    baskets, songs = baskets[order], songs[order]
+    starts = np.flatnonzero(np.r_[True, songs[1:] != songs[:-1]])
+    result = {}
+    for song_id, song_baskets in zip(songs[starts], np.split(baskets, starts[1:])):
+        digest = hashlib.blake2b(song_baskets.tobytes(), digest_size=8).digest()
+        result[int(song_id)] = int.from_bytes(digest, "big", signed=True)
+    return result
+
+
+def top_neighbors(similarity, song_ids, rows, top_k: int) -> List[tuple]:
+    """(song id, neighbor id, score) of the top_k columns of each similarity row"""
+    import numpy as np
+
+    neighbors = []
+    for offset, row in enumerate(rows):
+        start, end = similarity.indptr[offset], similarity.indptr[offset + 1]
+        columns = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        keep = columns != row
+        columns, scores = columns[keep], scores[keep]
+        # Ties go to the lower song id, so rebuilds pick the same neighbors
+        best = np.lexsort((columns, -scores))[:top_k]
+        columns, scores = columns[best], scores[best]
+        song_id = int(song_ids[row])
+        neighbors.extend(
+            (song_id, int(song_ids[column]), float(score))
+            for column, score in zip(columns, scores)
+        )
+    return neighbors
+
+
+def build(db: Session, top_k: int = None, full: bool = False) -> dict:
+    """
+    Recomputes song_neighbors for songs affected by interaction changes since the
+    previous build (every song when full), in one transaction. Reads all
+    interactions, the similarity matrix only covers baskets of affected songs
+    """
+    import numpy as np
+    from scipy import sparse
+
+    top_k = top_k or settings.recommendations_top_k
+    baskets, songs, weights = load_interactions(db)
+    current = signatures(baskets, songs)
+    previous = dict(
+        db.execute(
+            select(
+                models.SongInteractionState.song_id,
+                models.SongInteractionState.signature,
+            )
+        ).all()
+    )
+    changed = {
+        song_id
+        for song_id in current.keys() | previous.keys()
+        if current.get(song_id) != previous.get(song_id)
+    }
+
+    song_ids, columns = np.unique(songs, return_inverse=True)
+    basket_codes, rows = np.unique(baskets, return_inverse=True)
+    # A song is in a basket at most once, every song has at least one basket, so
+    # no norm is zero
+    norms = np.sqrt(np.bincount(columns, weights=weights * weights))
+
+    if full:
+        affected = set(song_ids.tolist()) | previous.keys()
+    else:
+        # Songs sharing a basket with a changed song, scores against it moved
+        changed_columns = np.flatnonzero(np.isin(song_ids, list(changed)))
+        touched_rows = np.unique(rows[np.isin(columns, changed_columns)])
+        shared = np.unique(columns[np.isin(rows, touched_rows)])
+        # Songs that had a changed song among their neighbors
+        stored = db.scalars(
+            select(models.SongNeighbor.song_id).where(
+                models.SongNeighbor.neighbor_id.in_(list(changed))
+            )
+        ).all()
+        affected = changed | set(song_ids[shared].tolist()) | set(stored)
+
+    affected_rows = np.flatnonzero(np.isin(song_ids, list(affected)))
+    # Scores of an affected song only involve the baskets it is in
+    kept = np.isin(rows, rows[np.isin(columns, affected_rows)])
+    normalized = sparse.csc_matrix(
+        (weights[kept] / norms[columns[kept]], (rows[kept], columns[kept])),
+        shape=(len(basket_codes), len(song_ids)),
+    )
+    neighbors = []
+    for block in chunks(affected_rows, SIMILARITY_BLOCK_SIZE):
+        similarity = sparse.csr_matrix(normalized[:, block].T @ normalized)
+        neighbors.extend(top_neighbors(similarity, song_ids, block, top_k))
+
+    write(db, affected, neighbors, {s: current[s] for s in changed if s in current})
+    # Songs left without likes or playlists
+    db.execute(
+        delete(models.SongInteractionState)
+        .where(models.SongInteractionState.song_id.in_(list(changed - current.keys())))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return {
+        "songs": len(song_ids),
+        "changed": len(changed),
+        "recomputed": len(affected),
+        "neighbors": len(neighbors),
+    }
+
+
+def write(
+    db: Session,
+    affected: Iterable[int],
+    neighbors: List[tuple],
+    states: Dict[int, int],
+):
+    for song_ids in chunks(list(affected), WRITE_BATCH_SIZE):
+        db.execute(
+            delete(models.SongNeighbor)
+            .where(models.SongNeighbor.song_id.in_(song_ids))
+            .execution_options(synchronize_session=False)
+        )
+    for batch in chunks(neighbors, WRITE_BATCH_SIZE):
+        computed = values(
+            column("song_id", Integer),
+            column("neighbor_id", Integer),
+            column("score", Float),
+            name="computed",
+        ).data(batch)
+        # Songs deleted since the interactions were read would fail the foreign key
+        db.execute(
+            insert(models.SongNeighbor).from_select(
+                ["song_id", "neighbor_id", "score"],
+                select(computed).join(
+                    models.Song, models.Song.id == computed.c.song_id
+                ),
+            )
+        )
+    for batch in chunks(list(states.items()), WRITE_BATCH_SIZE):
+        statement = insert(models.SongInteractionState).values(
+            [{"song_id": song_id, "signature": sig} for song_id, sig in batch]
+        )
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["song_id"],
+                set_={"signature": statement.excluded.signature},
+            )
+        )
@@ -0,0 +1,110 @@
+import logging
+import uuid
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from typing import Optional
+from . import cache, instrumentation, metrics
+from .config import settings
+from .serialization import ORJSONResponse
+
+""" Serialized responses of read-heavy routes, invalidated by tag from write handlers """
+
+logger = logging.getLogger(__name__)
+
+# Invalidating a tag replaces its version, entries keyed by the old version are
+# never read again and age out of the backend
+VERSION_TTL = 24 * 60 * 60
+EVERYTHING = "*"
+
+backend = cache.make_cache(
+    "responses", settings.response_cache_size, settings.response_cache_ttl_seconds
+)
+
+
+class CachedResponse:
+    """Result of lookup, either a hit ready to return or the key to store a miss under"""
+
+    def __init__(self, key: Optional[str], entry: Optional[dict] = None):
+        self.key = key
+        self.entry = entry
+
+    @property
+    def response(self) -> Optional[Response]:
+        if self.entry is None:
+            return None
+        return Response(
+            content=self.entry["body"],
+            media_type="application/json",
+            headers={**self.entry["headers"], "X-Cache": "HIT"},
+        )
+
+    async def store(self, content, response_model=None, headers=None) -> Response:
+        """
+        Serializes content as FastAPI would for response_model and caches the body,
+        without response_model content must already be plain data for orjson
+        """
+        if response_model is not None:
+            with instrumentation.serialization_timer():
+                content = jsonable_encoder(parse_obj_as(response_model, content))
+        headers = headers or {}
+        response = ORJSONResponse(content, headers={**headers, "X-Cache": "MISS"})
+        if self.key is not None:
+            await backend.set(
+                self.key, {"body": response.body.decode(), "headers": headers}
+            )
+        return response
+
+
+async def version(tag: str) -> str:
+    return await backend.get(f"version:{tag}") or "0"
+
+
+async def lookup(request: Request, tag: str, *vary) -> CachedResponse:
+    """
+    Cached response for the path and query params of request. tag names the data
+    the response is built from, vary adds anything else it differs by (a user id)
+    """
+    if settings.response_cache_ttl_seconds <= 0:
+        return CachedResponse(None)
+
+    params = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    key = ":".join(
+        [
+            await version(EVERYTHING),
+            await version(tag),
+            tag,
+            request.url.path,
+            params,
+            *map(str, vary),
+        ]
+    )
+    entry = await backend.get(key)
+    metrics.RESPONSE_CACHE_REQUESTS.labels(
+        tag.split(":")[0], "miss" if entry is None else "hit"
+    ).inc()
+    return CachedResponse(key, entry)
+
+
+async def invalidate(*tags: str):
+    """Drops every cached response under the given tags, EVERYTHING drops them all"""
+    for tag in set(tags):
+        await backend.set(f"version:{tag}", uuid.uuid4().hex, ttl=VERSION_TTL)
+
+
+def warn_if_per_worker(workers: int):
+    """
+    The memory backend keeps tag versions per process, so invalidate only reaches
+    the worker that handled the write, the others serve stale responses until
+    response_cache_ttl_seconds. Only the redis backend invalidates across workers
+    """
+    if (
+        workers > 1
+        and settings.cache_backend == "memory"
+        and settings.response_cache_ttl_seconds > 0
+    ):
+        logger.warning(
+            f"Response cache on the memory backend with {workers} workers, writes "
+            f"invalidate one worker and the others serve stale responses for up to "
+            f"{settings.response_cache_ttl_seconds}s, set CACHE_BACKEND=redis"
+        )
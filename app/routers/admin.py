@@ -0,0 +1,49 @@
+from fastapi import Depends, APIRouter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, oauth2, streaming
+from ..config import settings
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(oauth2.get_admin_user)],
+)
+
+# Exported columns per table, password hashes are never exported
+EXPORTS = {
+    "users": (models.User.id, models.User.email, models.User.created_at),
+    "playlists": (
+        models.Playlist.id,
+        models.Playlist.name,
+        models.Playlist.private,
+        models.Playlist.desc,
+        models.Playlist.created_by,
+        models.Playlist.created_at,
+        models.Playlist.updated_at,
+    ),
+}
+
+
+async def export(db: AsyncSession, table: str, format: str):
+    streaming.check_format(format)
+    columns = EXPORTS[table]
+    result = await db.stream(
+        select(*columns)
+        .order_by(columns[0])
+        .execution_options(yield_per=settings.database_yield_per)
+    )
+    return streaming.stream_result(result, format, filename=table)
+
+
+@router.get("/export/users")
+async def export_users(format: str = "ndjson", db: AsyncSession = Depends(get_db)):
+    """Full dump of all users as NDJSON or CSV, streamed from a server side cursor"""
+    return await export(db, "users", format)
+
+
+@router.get("/export/playlists")
+async def export_playlists(format: str = "ndjson", db: AsyncSession = Depends(get_db)):
+    """Full dump of all playlists, private ones included, as NDJSON or CSV"""
+    return await export(db, "playlists", format)
@@ -1,8 +1,11 @@
-from fastapi import Response, status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
+from fastapi import Request, Response, status, HTTPException, Depends, APIRouter
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List, Optional
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, response_cache, conditional, serialization
 from ..database import get_db
+from ..serialization import ORJSONResponse
 
 router = APIRouter(prefix="/artists", tags=["Artists"])
 
@@ -10,15 +13,15 @@ router = APIRouter(prefix="/artists", tags=["Artists"])
 @router.post(
     "/", status_code=status.HTTP_201_CREATED, response_model=schemas.ArtistCreateOut
 )
-def create_artist(
+async def create_artist(
     artist: schemas.ArtistCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Add an artist to the database"""
 
-    duplicate_artist = (
-        db.query(models.Artist).filter(models.Artist.name == artist.name).first()
+    duplicate_artist = await db.scalar(
+        select(models.Artist).where(models.Artist.name == artist.name)
     )
     if duplicate_artist:
         raise HTTPException(
@@ -28,8 +31,8 @@ def create_artist(
 
     new_artist = models.Artist(created_by=current_user.id, **artist.dict())
     db.add(new_artist)
-    db.commit()
-    db.refresh(new_artist)
+    await db.commit()
+    await db.refresh(new_artist)
     return new_artist
 
 
@@ -38,16 +41,15 @@ def create_artist(
     status_code=status.HTTP_202_ACCEPTED,
     response_model=schemas.ArtistCreateOut,
 )
-def update_artist(
+async def update_artist(
     id: int,
     updated_artist: schemas.ArtistCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Updates artist info if present and created_by == user.id"""
 
-    artist_query = db.query(models.Artist).filter(models.Artist.id == id)
-    artist = artist_query.first()
+    artist = await db.scalar(select(models.Artist).where(models.Artist.id == id))
 
     if artist == None:
         raise HTTPException(
@@ -61,21 +63,27 @@ def update_artist(
             detail=f"Not authorized to perform requested action",
         )
 
-    artist_query.update(updated_artist.dict(), synchronize_session=False)
-    db.commit()
-    return artist_query.first()
+    await db.execute(
+        update(models.Artist)
+        .where(models.Artist.id == id)
+        .values(**updated_artist.dict())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await db.refresh(artist)
+    await response_cache.invalidate(f"artist:{id}")
+    return artist
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_artist(
+async def delete_artist(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Deletes one artist from database if created_by == user.id"""
 
-    artist_query = db.query(models.Artist).filter(models.Artist.id == id)
-    artist = artist_query.first()
+    artist = await db.scalar(select(models.Artist).where(models.Artist.id == id))
 
     if artist == None:
         raise HTTPException(
@@ -89,41 +97,85 @@ def delete_artist(
             detail=f"Not authorized to perform requested action",
         )
 
-    artist_query.delete(synchronize_session=False)
-    db.commit()
+    # Songs of the artist go with it through ON DELETE CASCADE
+    song_ids = (
+        await db.scalars(select(models.Song.id).where(models.Song.artist_id == id))
+    ).all()
+    await db.execute(
+        delete(models.Artist)
+        .where(models.Artist.id == id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await response_cache.invalidate(
+        f"artist:{id}", *(f"song:{song_id}" for song_id in song_ids)
+    )
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/", response_model=List[schemas.ArtistsOut])
 # @router.get("/")
-def get_artists(
-    db: Session = Depends(get_db),
+async def get_artists(
+    db: AsyncSession = Depends(get_db),
     name: Optional[str] = "",
     limit: int = 10,
     skip: int = 0,
+    fields: Optional[str] = None,
 ):
-    """Returns a list of all artists in database if no query parameter entered"""
-
-    artists = (
-        db.query(models.Artist)
-        .filter(models.Artist.name.contains(name))
-        .limit(limit)
-        .offset(skip)
-        .all()
+    """
+    Returns a list of all artists in database if no query parameter entered
+    fields (e.g. id,name) selects only those columns
+    """
+    names = serialization.field_names(schemas.ArtistsOut, fields)
+    artist_query = select(
+        *serialization.columns(schemas.ArtistsOut, models.Artist, names)
     )
+    if name:
+        artist_query = artist_query.where(models.Artist.name.contains(name))
+    artists = await db.execute(artist_query.limit(limit).offset(skip))
 
-    return artists
+    return ORJSONResponse(serialization.rows(artists))
 
 
 # @router.get("/{id}")
 @router.get("/{id}", response_model=schemas.ArtistOut)
-def get_artist(id: int, db: Session = Depends(get_db)):
+async def get_artist(id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Returns one artist by id with a list of their related songs"""
+    cached = await response_cache.lookup(request, f"artist:{id}")
+    if cached.response:
+        return conditional.not_modified(request, cached.response.headers) or (
+            cached.response
+        )
 
-    artist = db.query(models.Artist).filter(models.Artist.id == id).first()
+    # Removed songs leave no timestamp behind, they change the count and id sum
+    state = (
+        await db.execute(
+            select(
+                func.coalesce(models.Artist.updated_at, models.Artist.created_at),
+                func.max(func.coalesce(models.Song.updated_at, models.Song.created_at)),
+                func.count(models.Song.id),
+                func.sum(models.Song.id),
+            )
+            .outerjoin(models.Song, models.Song.artist_id == models.Artist.id)
+            .where(models.Artist.id == id)
+            .group_by(models.Artist.id)
+        )
+    ).first()
+    headers = conditional.validators(request, state or ())
+    not_modified = state and conditional.not_modified(request, headers)
+    if not_modified:
+        return not_modified
+
+    # One artist row, its songs come back in the same statement
+    result = await db.execute(
+        select(models.Artist)
+        .options(joinedload(models.Artist.songs))
+        .where(models.Artist.id == id)
+    )
+    artist = result.unique().scalar_one_or_none()
     if not artist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Artist with id: {id} was not found",
         )
-    return artist
+    return await cached.store(artist, schemas.ArtistOut, headers)
@@ -1,21 +1,20 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import database, schemas, models, utils, oauth2
 
 router = APIRouter(tags=["Authentication"])
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     user_credentials: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     # OAuth2PasswordRequestForm only allows username, not email, for return field
-    user = (
-        db.query(models.User)
-        .filter(models.User.email == user_credentials.username)
-        .first()
+    user = await db.scalar(
+        select(models.User).where(models.User.email == user_credentials.username)
     )
 
     if not user:
@@ -23,11 +22,24 @@ def login(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials"
         )
 
-    if not utils.verify(user_credentials.password, user.password):
+    valid, new_hash = await utils.verify_and_update_async(
+        user_credentials.password, user.password
+    )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials"
         )
 
+    # Stored hash used an outdated bcrypt cost, replace it while we have the password
+    if new_hash:
+        await db.execute(
+            update(models.User)
+            .where(models.User.id == user.id)
+            .values(password=new_hash)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
     access_token = oauth2.create_access_token(
         data={"user_id": user.id, "username": user.email}
     )
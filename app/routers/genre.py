@@ -1,31 +1,48 @@
-from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from .. import models, schemas, utils
+from fastapi import Request, status, HTTPException, Depends, APIRouter
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, utils, response_cache, conditional, serialization
 from ..database import get_db
 
 router = APIRouter(prefix="/genres", tags=["Genres"])
 
 
 @router.post("/")
-def create_genre(genre: schemas.GenreCreate, db: Session = Depends(get_db)):
+async def create_genre(genre: schemas.GenreCreate, db: AsyncSession = Depends(get_db)):
     """Add new genre to db"""
 
-    duplicate_genre = (
-        db.query(models.Genre).filter(models.Genre.genre == genre.genre).first()
+    duplicate_genre = await db.scalar(
+        select(models.Genre).where(models.Genre.genre == genre.genre_id)
     )
     if duplicate_genre:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
-            detail=f"Genre with name: '{genre.genre}' already exists",
+            detail=f"Genre with name: '{genre.genre_id}' already exists",
         )
-    new_genre = models.Genre(**genre.dict())
+    new_genre = models.Genre(genre=genre.genre_id)
     db.add(new_genre)
-    db.commit()
-    db.refresh(new_genre)
+    await db.commit()
+    await db.refresh(new_genre)
+    await response_cache.invalidate("genres")
     return new_genre
 
 
 @router.get("/")
-def get_genres(db: Session = Depends(get_db)):
-    genres = db.query(models.Genre).all()
-    return genres
+async def get_genres(request: Request, db: AsyncSession = Depends(get_db)):
+    cached = await response_cache.lookup(request, "genres")
+    if cached.response:
+        return conditional.not_modified(request, cached.response.headers) or (
+            cached.response
+        )
+
+    # Genres are only ever added
+    state = (
+        await db.execute(select(func.count(models.Genre.id), func.max(models.Genre.id)))
+    ).first()
+    headers = conditional.validators(request, state)
+    not_modified = conditional.not_modified(request, headers)
+    if not_modified:
+        return not_modified
+
+    genres = await db.execute(select(models.Genre.id, models.Genre.genre))
+    return await cached.store(serialization.rows(genres), headers=headers)
@@ -1,39 +1,52 @@
 from fastapi import Response, status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from .. import schemas, database, models, oauth2
-
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import schemas, database, models, oauth2, response_cache, like_buffer
+from ..config import settings
 
 router = APIRouter(prefix="/like", tags=["Like"])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def like_song(
+async def like_song(
     like: schemas.Like,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
-    """Create like = 1 or remove like = 0 from song_id"""
+    """
+    Create like = 1 or remove like = 0 from song_id
+    With like_write_behind the change is queued and written by the next flush
+    """
 
-    song = db.query(models.Song).filter(models.Song.id == like.song_id).first()
+    song = await db.scalar(select(models.Song.id).where(models.Song.id == like.song_id))
     if not song:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Song {like.song_id} does not exist",
         )
-    like_query = db.query(models.Like).filter(
+    like_filter = (
         models.Like.song_id == like.song_id,
         models.Like.created_by == current_user.id,
     )
-    found_like = like_query.first()
+    found_like = await db.scalar(select(models.Like.song_id).where(*like_filter))
+    if settings.like_write_behind:
+        # Unwritten taps of this worker are newer than the database
+        state = like_buffer.buffer.state(current_user.id, like.song_id)
+        if state is not None:
+            found_like = state == 1
     if like.dir == 1:
         if found_like:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"User {current_user.id} has already liked song {like.song_id}",
             )
-        new_like = models.Like(song_id=like.song_id, created_by=current_user.id)
-        db.add(new_like)
-        db.commit()
+        if settings.like_write_behind:
+            await like_buffer.buffer.add(current_user.id, like.song_id, 1)
+        else:
+            new_like = models.Like(song_id=like.song_id, created_by=current_user.id)
+            db.add(new_like)
+            await db.commit()
+            await response_cache.invalidate(f"song:{like.song_id}")
         return {
             "message": f"User {current_user.id} successfully liked song {like.song_id}"
         }
@@ -43,8 +56,16 @@ def like_song(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Like does not exist"
             )
 
-        like_query.delete(synchronize_session=False)
-        db.commit()
+        if settings.like_write_behind:
+            await like_buffer.buffer.add(current_user.id, like.song_id, 0)
+        else:
+            await db.execute(
+                delete(models.Like)
+                .where(*like_filter)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            await response_cache.invalidate(f"song:{like.song_id}")
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
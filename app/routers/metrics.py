@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .. import metrics, oauth2
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get(
+    "/metrics",
+    include_in_schema=False,
+    dependencies=[Depends(oauth2.get_admin_user)],
+)
+async def get_metrics():
+    """Prometheus scrape endpoint for admins, scrapers without a token use metrics_port"""
+    return Response(
+        content=generate_latest(metrics.registry()), media_type=CONTENT_TYPE_LATEST
+    )
@@ -1,8 +1,10 @@
-from fastapi import Response, status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
+from fastapi import Request, Response, status, HTTPException, Depends, APIRouter, Query
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.expression import or_
 from typing import List, Optional
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, pagination, response_cache, conditional
+from .. import serialization
 from ..database import get_db
 
 router = APIRouter(prefix="/playlists", tags=["Playlists"])
@@ -13,16 +15,15 @@ router = APIRouter(prefix="/playlists", tags=["Playlists"])
     status_code=status.HTTP_201_CREATED,
     response_model=schemas.PlaylistOut,
 )
-def create_playlist(
+async def create_playlist(
     playlist: schemas.PlaylistCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
-    duplicate_playlist = (
-        db.query(models.Playlist)
-        .filter(models.Playlist.name == playlist.name)
-        .filter(models.Playlist.created_by == current_user.id)
-        .first()
+    duplicate_playlist = await db.scalar(
+        select(models.Playlist)
+        .where(models.Playlist.name == playlist.name)
+        .where(models.Playlist.created_by == current_user.id)
     )
     if duplicate_playlist:
         raise HTTPException(
@@ -31,8 +32,9 @@ def create_playlist(
         )
     new_playlist = models.Playlist(created_by=current_user.id, **playlist.dict())
     db.add(new_playlist)
-    db.commit()
-    db.refresh(new_playlist)
+    await db.commit()
+    await db.refresh(new_playlist)
+    await response_cache.invalidate("playlists")
     return new_playlist
 
 
@@ -41,14 +43,13 @@ def create_playlist(
     status_code=status.HTTP_202_ACCEPTED,
     response_model=schemas.PlaylistOut,
 )
-def update_playlist(
+async def update_playlist(
     id: int,
     updated_playlist: schemas.PlaylistUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
-    playlist_query = db.query(models.Playlist).filter(models.Playlist.id == id)
-    playlist = playlist_query.first()
+    playlist = await db.scalar(select(models.Playlist).where(models.Playlist.id == id))
 
     if playlist == None:
         raise HTTPException(
@@ -62,19 +63,25 @@ def update_playlist(
             detail=f"Not authorized to perform requested action",
         )
 
-    playlist_query.update(updated_playlist.dict(), synchronize_session=False)
-    db.commit()
-    return playlist_query.first()
+    await db.execute(
+        update(models.Playlist)
+        .where(models.Playlist.id == id)
+        .values(**updated_playlist.dict())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await db.refresh(playlist)
+    await response_cache.invalidate("playlists")
+    return playlist
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_playlist(
+async def delete_playlist(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
-    playlist_query = db.query(models.Playlist).filter(models.Playlist.id == id)
-    playlist = playlist_query.first()
+    playlist = await db.scalar(select(models.Playlist).where(models.Playlist.id == id))
 
     if playlist == None:
         raise HTTPException(
@@ -88,42 +95,97 @@ def delete_playlist(
             detail=f"Not authorized to perform requested action",
         )
 
-    playlist_query.delete(synchronize_session=False)
-    db.commit()
+    await db.execute(
+        delete(models.Playlist)
+        .where(models.Playlist.id == id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await response_cache.invalidate("playlists")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/{id}", response_model=schemas.PlaylistOut)
-def get_playlist(id: int, db: Session = Depends(get_db)):
-
-    playlist = db.query(models.Playlist).filter(models.Playlist.id == id).first()
+async def get_playlist(
+    id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)
+):
+    """One playlist by id, answers 304 when If-None-Match or If-Modified-Since still hold"""
+    playlist = await db.scalar(select(models.Playlist).where(models.Playlist.id == id))
     if not playlist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Playlist with id: {id} was not found",
         )
+
+    # A single narrow row, validating from it costs less than a second query
+    last_modified = playlist.updated_at or playlist.created_at
+    headers = conditional.validators(request, (last_modified,), last_modified)
+    not_modified = conditional.not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    response.headers.update(headers)
     return playlist
 
 
 @router.get("/", response_model=List[schemas.PlaylistOut])
 # @router.get("/")
-def get_playlists(
-    db: Session = Depends(get_db),
+async def get_playlists(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
     name: Optional[str] = "",
     tags: Optional[str] = "",
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
 ):
-    """Get playlist by name and/or tags, else retrieve all public and user created playlists"""
+    """
+    Get playlist by name and/or tags, else retrieve all public and user created playlists
+    Pages are ordered by id, pass the X-Next-Cursor header back as cursor for the next
+    fields (e.g. id,name) selects only those columns
+    """
+    names = serialization.field_names(schemas.PlaylistOut, fields)
+    # Private playlists of the user are listed too, so entries are per user
+    cached = await response_cache.lookup(request, "playlists", current_user.id)
+    if cached.response:
+        return conditional.not_modified(request, cached.response.headers) or (
+            cached.response
+        )
 
-    playlist_query = db.query(models.Playlist).filter(
-        models.Playlist.name.contains(name)
-    )
-    # .filter(models.Playlist.tags.contains(tags))
+    # The cursor and validators need id and the timestamps whatever fields says
+    selected = {*names, "id", "created_at", "updated_at"}
+    playlist_query = select(
+        *serialization.columns(schemas.PlaylistOut, models.Playlist, selected)
+    ).where(models.Playlist.name.contains(name))
+    # .where(models.Playlist.tags.contains(tags))
     or_expression = or_(
         models.Playlist.private == False,
         models.Playlist.created_by == current_user.id,
     )
-    or_query = playlist_query.filter(or_expression)
-    playlists = or_query.all()
-
-    return playlists
+    or_query = playlist_query.where(or_expression).order_by(models.Playlist.id)
+    if cursor is not None:
+        (last_id,) = pagination.decode_cursor(cursor, int)
+        or_query = or_query.where(models.Playlist.id > last_id)
+    # Validators of the page from an aggregate over the same rows
+    page = or_query.limit(limit).subquery()
+    state = (
+        await db.execute(
+            select(
+                func.max(func.coalesce(page.c.updated_at, page.c.created_at)),
+                func.count(),
+                func.sum(page.c.id),
+                current_user.id,
+            )
+        )
+    ).first()
+    headers = conditional.validators(request, state)
+    not_modified = conditional.not_modified(request, headers)
+    if not_modified:
+        return not_modified
+
+    playlists = (await db.execute(or_query.limit(limit))).all()
+    if len(playlists) == limit:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(
+            playlists[-1].id
+        )
+    return await cached.store(serialization.rows(playlists, names), headers=headers)
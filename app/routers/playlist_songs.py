@@ -1,28 +1,48 @@
-from fastapi import Response, status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
+from fastapi import Request, Response, status, HTTPException, Depends, APIRouter, Query
+from sqlalchemy import case, delete, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import models, schemas, oauth2, pagination, streaming
+from ..config import settings
 from ..database import get_db
 
 router = APIRouter(prefix="/playlist-songs", tags=["PlaylistSongs"])
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def add_playlist_song(
-    playlist_song: schemas.PlaylistSongs,
-    db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user),
-):
-    """Add one song to existing playlist"""
-    playlist_query = db.query(models.Playlist).filter(
-        playlist_song.playlist_id == models.Playlist.id
+def next_position(playlist_id: int):
+    """Position after the last track of the playlist"""
+    return (
+        select(func.coalesce(func.max(models.PlaylistSongs.position), 0) + 1)
+        .where(models.PlaylistSongs.playlist_id == playlist_id)
+        .scalar_subquery()
     )
-    playlist = playlist_query.first()
 
+
+async def get_playlist_for_update(db: AsyncSession, playlist_id: int):
+    """Locks the playlist row so concurrent batches number positions in turn"""
+    playlist = await db.scalar(
+        select(models.Playlist)
+        .where(models.Playlist.id == playlist_id)
+        .with_for_update()
+    )
     if playlist is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Playlist with id: {playlist_song.playlist_id} not found",
+            detail=f"Playlist with id: {playlist_id} not found",
         )
+    return playlist
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def add_playlist_song(
+    playlist_song: schemas.PlaylistSongs,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Add one song to existing playlist"""
+    # Held until the commit, concurrent adds to the playlist take positions in turn
+    playlist = await get_playlist_for_update(db, playlist_song.playlist_id)
 
     if playlist.created_by != current_user.id and playlist.private == True:
         raise HTTPException(
@@ -30,8 +50,9 @@ def add_playlist_song(
             detail=f"Not authorized to perform requested action",
         )
 
-    song_query = db.query(models.Song).filter(playlist_song.song_id == models.Song.id)
-    song = song_query.first()
+    song = await db.scalar(
+        select(models.Song).where(playlist_song.song_id == models.Song.id)
+    )
     if song is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -40,12 +61,15 @@ def add_playlist_song(
 
     try:
         new_playlist_song = models.PlaylistSongs(
-            created_by=current_user.id, **playlist_song.dict()
+            created_by=current_user.id,
+            position=next_position(playlist_song.playlist_id),
+            **playlist_song.dict(),
         )
         db.add(new_playlist_song)
-        db.commit()
-        db.refresh(new_playlist_song)
+        await db.commit()
+        await db.refresh(new_playlist_song)
     except:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Unkown Error: Unable to add song to playlist",
@@ -54,16 +78,127 @@ def add_playlist_song(
     return {"messgage": "Song successfully added to playlist"}
 
 
+@router.post("/{playlist_id}/batch", response_model=schemas.PlaylistSongsBatchOut)
+async def batch_playlist_songs(
+    playlist_id: int,
+    changes: schemas.PlaylistSongsBatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """
+    Add and remove many songs of a playlist in one transaction, added songs are
+    appended in the given order and songs already in the playlist are left in place
+    """
+    playlist = await get_playlist_for_update(db, playlist_id)
+
+    if (changes.remove or playlist.private) and playlist.created_by != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not authorized to perform requested action",
+        )
+
+    add = list(dict.fromkeys(changes.add))
+    added = []
+    if add:
+        found = set(
+            await db.scalars(select(models.Song.id).where(models.Song.id.in_(add)))
+        )
+        missing = [song_id for song_id in add if song_id not in found]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Songs with id: {missing} not found",
+            )
+
+        start = await db.scalar(select(next_position(playlist_id)))
+        inserted = await db.scalars(
+            insert(models.PlaylistSongs)
+            .values(
+                [
+                    {
+                        "playlist_id": playlist_id,
+                        "song_id": song_id,
+                        "position": start + offset,
+                        "created_by": current_user.id,
+                    }
+                    for offset, song_id in enumerate(add)
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["song_id", "playlist_id"])
+            .returning(models.PlaylistSongs.song_id)
+        )
+        inserted = set(inserted)
+        added = [song_id for song_id in add if song_id in inserted]
+
+    removed = []
+    if changes.remove:
+        removed = (
+            await db.scalars(
+                delete(models.PlaylistSongs)
+                .where(
+                    models.PlaylistSongs.playlist_id == playlist_id,
+                    models.PlaylistSongs.song_id.in_(set(changes.remove)),
+                )
+                .returning(models.PlaylistSongs.song_id)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+
+    await db.commit()
+    return {"added": added, "removed": sorted(removed)}
+
+
+@router.put("/{playlist_id}/order", status_code=status.HTTP_204_NO_CONTENT)
+async def reorder_playlist_songs(
+    playlist_id: int,
+    order: schemas.PlaylistSongsOrder,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Set the track order of a playlist, song_ids must list every song in it once"""
+    playlist = await get_playlist_for_update(db, playlist_id)
+
+    if playlist.created_by != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not authorized to perform requested action",
+        )
+
+    current = set(
+        await db.scalars(
+            select(models.PlaylistSongs.song_id).where(
+                models.PlaylistSongs.playlist_id == playlist_id
+            )
+        )
+    )
+    if len(order.song_ids) != len(current) or set(order.song_ids) != current:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"song_ids must list each of the {len(current)} songs in playlist id: {playlist_id} once",
+        )
+
+    if current:
+        positions = {song_id: index for index, song_id in enumerate(order.song_ids, 1)}
+        await db.execute(
+            update(models.PlaylistSongs)
+            .where(models.PlaylistSongs.playlist_id == playlist_id)
+            .values(position=case(positions, value=models.PlaylistSongs.song_id))
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @router.delete("/{playlist_id}/{song_id}")
-def delete_playlist_song(
+async def delete_playlist_song(
     playlist_id: int,
     song_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Delete a song from existing playlist"""
-    playlist = (
-        db.query(models.Playlist).filter(models.Playlist.id == playlist_id).first()
+    playlist = await db.scalar(
+        select(models.Playlist).where(models.Playlist.id == playlist_id)
     )
 
     if current_user.id != playlist.created_by:
@@ -72,30 +207,53 @@ def delete_playlist_song(
             detail="Not authorized to perform this action",
         )
 
-    playlist_song_query = db.query(models.PlaylistSongs).filter(
+    playlist_song_filter = (
         models.PlaylistSongs.playlist_id == playlist_id,
         models.PlaylistSongs.song_id == song_id,
     )
 
-    if playlist_song_query.first() is None:
+    playlist_song = await db.scalar(
+        select(models.PlaylistSongs).where(*playlist_song_filter)
+    )
+    if playlist_song is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Playlist id: {playlist_id} with song id: {song_id} not found",
         )
 
-    playlist_song_query.delete(synchronize_session=False)
-    db.commit()
+    await db.execute(
+        delete(models.PlaylistSongs)
+        .where(*playlist_song_filter)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@router.get("/{id}")
-def get_playlist_songs(
+@router.get("/{id}", response_model=List[schemas.PlaylistTrack])
+async def get_playlist_songs(
     id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    stream: bool = False,
 ):
-    """Display a list of songs in given playlist id"""
-    playlist = db.query(models.Playlist).filter(models.Playlist.id == id).first()
+    """
+    Display the songs of given playlist id in track order with artist, genre and likes
+    Pass the X-Next-Cursor header of a page back as cursor to fetch the next page.
+    With stream=true every remaining track is streamed instead, as NDJSON when
+    application/x-ndjson is accepted, else as a JSON array
+    """
+    playlist = await db.scalar(select(models.Playlist).where(models.Playlist.id == id))
+
+    if playlist is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Playlist with id: {id} not found",
+        )
 
     if playlist.created_by != current_user.id and playlist.private == True:
         raise HTTPException(
@@ -103,9 +261,41 @@ def get_playlist_songs(
             detail=f"Not authorized to perform requested action",
         )
 
-    playlist_songs = (
-        db.query(models.Song)
-        .join(models.PlaylistSongs)
-        .filter(models.PlaylistSongs.playlist_id == id)
-    ).all()
-    return playlist_songs
+    track_query = (
+        select(
+            models.PlaylistSongs.position,
+            models.Song.id,
+            models.Song.title,
+            models.Song.length,
+            models.Song.artist_id,
+            models.Artist.name.label("artist"),
+            models.Song.genre_id,
+            models.Genre.genre,
+            models.Song.like_count,
+        )
+        .join(models.Song, models.Song.id == models.PlaylistSongs.song_id)
+        .join(models.Artist, models.Artist.id == models.Song.artist_id)
+        .outerjoin(models.Genre, models.Genre.id == models.Song.genre_id)
+        .where(models.PlaylistSongs.playlist_id == id)
+        .order_by(models.PlaylistSongs.position, models.PlaylistSongs.song_id)
+    )
+    if cursor is not None:
+        last_position, last_id = pagination.decode_cursor(cursor, int, int)
+        track_query = track_query.where(
+            tuple_(models.PlaylistSongs.position, models.PlaylistSongs.song_id)
+            > tuple_(last_position, last_id)
+        )
+
+    if stream:
+        ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+        result = await db.stream(
+            track_query.execution_options(yield_per=settings.database_yield_per)
+        )
+        return streaming.stream_result(result, "ndjson" if ndjson else "json")
+
+    tracks = (await db.execute(track_query.limit(limit))).all()
+    if len(tracks) == limit:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(
+            tracks[-1].position, tracks[-1].id
+        )
+    return tracks
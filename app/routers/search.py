@@ -0,0 +1,57 @@
+from fastapi import Depends, APIRouter, Query
+from sqlalchemy import case, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from .. import models, schemas
+from ..database import get_db
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+# (result type, id column, name column, extra filters), the name columns are
+# searched through their trigram indexes
+SEARCH_SOURCES = [
+    ("song", models.Song.id, models.Song.title, []),
+    ("artist", models.Artist.id, models.Artist.name, []),
+    (
+        "playlist",
+        models.Playlist.id,
+        models.Playlist.name,
+        [models.Playlist.private == False],
+    ),
+]
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get("/", response_model=List[schemas.SearchResult])
+async def search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Ranked search across song titles, artist names and public playlist names
+    Prefix matches rank first, then typo tolerant trigram word similarity
+    """
+    results = []
+    for result_type, id_column, name_column, filters in SEARCH_SOURCES:
+        prefix_match = name_column.ilike(f"{escape_like(q)}%", escape="\\")
+        score = case(
+            (prefix_match, literal(1.0)),
+            else_=func.word_similarity(q, name_column),
+        ).label("score")
+        rows = await db.execute(
+            select(id_column, name_column, score)
+            .where(or_(prefix_match, literal(q).op("<%")(name_column)), *filters)
+            .order_by(score.desc())
+            .limit(limit)
+        )
+        results.extend(
+            {"type": result_type, "id": row[0], "name": row[1], "score": row.score}
+            for row in rows
+        )
+
+    results.sort(key=lambda result: result["score"], reverse=True)
+    return results[:limit]
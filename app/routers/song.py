@@ -1,22 +1,32 @@
-from fastapi import Response, status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
+from fastapi import Request, Response, status, HTTPException, Depends, APIRouter, Query
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Union
-from sqlalchemy import func
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, pagination, bulk_import, response_cache
+from .. import conditional, serialization, trending
 from ..database import get_db
+from ..serialization import ORJSONResponse
 
 router = APIRouter(prefix="/songs", tags=["Songs"])
 
 
+def is_duplicate_song(error: IntegrityError) -> bool:
+    """Whether error is a violation of uq_songs_artist_id_title"""
+    return "uq_songs_artist_id_title" in str(error.orig)
+
+
 @router.post("/", response_model=schemas.Song)
-def create_song(
+async def create_song(
     song: schemas.SongCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Add one song to database, artist_id required"""
     # Check for presence of artist.id in db
-    artist = db.query(models.Artist).filter(models.Artist.id == song.artist_id).first()
+    artist = await db.scalar(
+        select(models.Artist).where(models.Artist.id == song.artist_id)
+    )
     if artist is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -46,7 +56,9 @@ def create_song(
     #                 status_code=status.HTTP_404_NOT_FOUND,
     #                 detail=f"Genre id: {song.genre} not found",
     #             )
-    genre = db.query(models.Genre).filter(models.Genre.id == song.genre_id).first()
+    genre = await db.scalar(
+        select(models.Genre).where(models.Genre.id == song.genre_id)
+    )
     if genre is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -54,11 +66,10 @@ def create_song(
         )
 
     # Check if song is already in db under assigned artist
-    duplicate_song = (
-        db.query(models.Artist)
-        .join(models.Song)
-        .filter(models.Artist.id == song.artist_id, models.Song.title == song.title)
-        .first()
+    duplicate_song = await db.scalar(
+        select(models.Song.id).where(
+            models.Song.artist_id == song.artist_id, models.Song.title == song.title
+        )
     )
     if duplicate_song:
         raise HTTPException(
@@ -69,24 +80,55 @@ def create_song(
     new_song = models.Song(created_by=current_user.id, **song.dict())
     print(new_song)
     db.add(new_song)
-    db.commit()
-    db.refresh(new_song)
+    # A concurrent create of the same song can pass the check above
+    try:
+        await db.commit()
+    except IntegrityError as error:
+        if not is_duplicate_song(error):
+            raise
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Artist with id: {song.artist_id} and song title: '{song.title}' already exists",
+        )
+    await db.refresh(new_song)
+    await response_cache.invalidate(f"artist:{new_song.artist_id}")
     return new_song
 
 
+@router.post(
+    "/bulk", status_code=status.HTTP_201_CREATED, response_model=schemas.BulkImportOut
+)
+async def bulk_create_songs(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """
+    Add many songs from a text/csv (header row first) or application/x-ndjson body,
+    the body is streamed and inserted in batches, invalid rows are reported and skipped
+    """
+    format = bulk_import.format_from_content_type(request.headers.get("content-type"))
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be one of: {', '.join(bulk_import.FORMATS)}",
+        )
+    return await bulk_import.import_songs(db, request.stream(), format, current_user.id)
+
+
 @router.put(
     "/{id}", status_code=status.HTTP_202_ACCEPTED, response_model=schemas.SongUpdateOut
 )
-def update_song(
+async def update_song(
     id: int,
     updated_song: schemas.SongUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Update song info if present and created_by == user"""
 
-    song_query = db.query(models.Song).filter(models.Song.id == id)
-    song = song_query.first()
+    song = await db.scalar(select(models.Song).where(models.Song.id == id))
 
     if song == None:
         raise HTTPException(
@@ -100,75 +142,211 @@ def update_song(
             detail=f"Not authorized to perform requested action",
         )
 
-    song_query.update(updated_song.dict(), synchronize_session=False)
-    db.commit()
-    return song_query.first()
+    previous_artist_id = song.artist_id
+    # uq_songs_artist_id_title does the duplicate check of create_song, race free
+    try:
+        await db.execute(
+            update(models.Song)
+            .where(models.Song.id == id)
+            .values(**updated_song.dict())
+            .execution_options(synchronize_session=False)
+        )
+    except IntegrityError as error:
+        if not is_duplicate_song(error):
+            raise
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Artist with id: {updated_song.artist_id} and song title: '{updated_song.title}' already exists",
+        )
+    await db.commit()
+    await db.refresh(song)
+    await response_cache.invalidate(
+        f"song:{id}", f"artist:{previous_artist_id}", f"artist:{song.artist_id}"
+    )
+    return song
 
 
 @router.get("/", response_model=List[schemas.SongsOut])
-def get_songs(
-    db: Session = Depends(get_db),
+async def get_songs(
+    db: AsyncSession = Depends(get_db),
     title: Optional[str] = "",
     genre_id: Optional[int] = "",
     limit: int = 20,
     skip: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
 ):
     """
     Retrieves all songs by query, default is all if no parameter given
     Genre_id accepts both string and int types
+    Pass the X-Next-Cursor header of a page back as cursor to fetch the next page,
+    skip is ignored when a cursor is given
+    fields (e.g. id,title,likes) selects only those song columns and likes
     """
+    names = serialization.field_names(schemas.Song, fields, extra=["likes"])
+    song_fields = [name for name in names if name != "likes"]
+    with_likes = "likes" in names
+    selected = serialization.columns(schemas.Song, models.Song, song_fields)
+    if with_likes:
+        selected.append(models.Song.like_count.label("likes"))
+    # Cursor key, selected even when fields leaves id out
+    song_query = select(*selected, models.Song.id.label("cursor_id"))
+    if title:
+        song_query = song_query.where(models.Song.title.contains(title))
     if genre_id:
+        song_query = song_query.where(models.Song.genre_id == genre_id)
+    song_query = song_query.order_by(models.Song.id)
 
-        results = (
-            db.query(models.Song, func.count(models.Like.song_id).label("likes"))
-            .join(models.Like, models.Like.song_id == models.Song.id, isouter=True)
-            .filter(models.Song.title.contains(title))
-            .filter(models.Song.genre_id == genre_id)
-            .order_by(models.Song.id)
-            .group_by(models.Song.id)
-            .limit(limit)
-            .offset(skip)
-        ).all()
+    if cursor is not None:
+        (last_id,) = pagination.decode_cursor(cursor, int)
+        song_query = song_query.where(models.Song.id > last_id)
     else:
-        results = (
-            db.query(models.Song, func.count(models.Like.song_id).label("likes"))
-            .join(models.Like, models.Like.song_id == models.Song.id, isouter=True)
-            .filter(models.Song.title.contains(title))
-            .order_by(models.Song.id)
-            .group_by(models.Song.id)
+        song_query = song_query.offset(skip)
+
+    results = (await db.execute(song_query.limit(limit))).all()
+
+    headers = {}
+    if results and len(results) == limit:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(
+            results[-1].cursor_id
+        )
+    # SongsOut shaped, without validating every row through orm_mode
+    songs = [
+        {"Song": dict(zip(song_fields, row)), "likes": row.likes}
+        if with_likes
+        else {"Song": dict(zip(song_fields, row))}
+        for row in results
+    ]
+    return ORJSONResponse(songs, headers=headers)
+
+
+@router.get("/trending", response_model=List[schemas.SongsOut])
+async def get_trending_songs(
+    db: AsyncSession = Depends(get_db),
+    window: str = "week",
+    genre_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    """
+    Most liked songs over the last day, week or month, likes counts only that window
+    Read from the trending_songs view, so counts lag by up to trending_refresh_seconds
+    """
+    trending.check_period(window)
+    ranked = trending.trending_songs
+    song_fields = list(schemas.Song.__fields__)
+    trending_query = (
+        select(*serialization.columns(schemas.Song, models.Song), ranked.c.likes)
+        .join(models.Song, models.Song.id == ranked.c.song_id)
+        .where(ranked.c.period == window)
+        .order_by(ranked.c.likes.desc(), ranked.c.song_id)
+        .limit(limit)
+    )
+    if genre_id is not None:
+        trending_query = trending_query.where(ranked.c.genre_id == genre_id)
+    if cursor is not None:
+        last_likes, last_id = pagination.decode_cursor(cursor, int, int)
+        trending_query = trending_query.where(
+            or_(
+                ranked.c.likes < last_likes,
+                and_(ranked.c.likes == last_likes, ranked.c.song_id > last_id),
+            )
+        )
+    results = (await db.execute(trending_query)).all()
+
+    headers = {}
+    if len(results) == limit:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(
+            results[-1].likes, results[-1].id
+        )
+    songs = [
+        {"Song": dict(zip(song_fields, row)), "likes": row.likes} for row in results
+    ]
+    return ORJSONResponse(songs, headers=headers)
+
+
+@router.get("/{id}/similar", response_model=List[schemas.SongScoreOut])
+async def get_similar_songs(
+    id: int,
+    db: AsyncSession = Depends(get_db),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Songs most often liked or playlisted together with song id, from the
+    song_neighbors index built by python -m app.cli build-recommendations
+    """
+    neighbor = models.SongNeighbor
+    song_fields = list(schemas.Song.__fields__)
+    results = (
+        await db.execute(
+            select(*serialization.columns(schemas.Song, models.Song), neighbor.score)
+            .join(models.Song, models.Song.id == neighbor.neighbor_id)
+            .where(neighbor.song_id == id)
+            .order_by(neighbor.score.desc(), neighbor.neighbor_id)
             .limit(limit)
-            .offset(skip)
-        ).all()
-    return results
+        )
+    ).all()
+    # Only songs without neighbors pay for the existence check
+    if not results and not await db.scalar(
+        select(models.Song.id).where(models.Song.id == id)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Song with id: {id} was not found",
+        )
+    return ORJSONResponse(
+        [{"Song": dict(zip(song_fields, row)), "score": row.score} for row in results]
+    )
 
 
 @router.get("/{id}", response_model=schemas.SongsOut)
-def get_song(id: int, db: Session = Depends(get_db)):
+async def get_song(id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Return one song from database with id"""
+    cached = await response_cache.lookup(request, f"song:{id}")
+    if cached.response:
+        return conditional.not_modified(request, cached.response.headers) or (
+            cached.response
+        )
+
+    # like_count changes leave updated_at alone, so there is no Last-Modified
+    state = (
+        await db.execute(
+            select(
+                func.coalesce(models.Song.updated_at, models.Song.created_at),
+                models.Song.like_count,
+            ).where(models.Song.id == id)
+        )
+    ).first()
+    headers = conditional.validators(request, state or ())
+    not_modified = state and conditional.not_modified(request, headers)
+    if not_modified:
+        return not_modified
+
     song = (
-        db.query(models.Song, func.count(models.Like.song_id).label("likes"))
-        .join(models.Like, models.Like.song_id == models.Song.id, isouter=True)
-        .group_by(models.Song.id)
-        .filter(models.Song.id == id)
+        await db.execute(
+            select(models.Song, models.Song.like_count.label("likes")).where(
+                models.Song.id == id
+            )
+        )
     ).first()
     if not song:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Song with id: {id} was not found",
         )
-    return song
+    return await cached.store(song, schemas.SongsOut, headers)
 
 
 @router.delete("/{id}")
-def delete_song(
+async def delete_song(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Delete one song from database with id"""
 
-    song_query = db.query(models.Song).filter(models.Song.id == id)
-    song = song_query.first()
+    song = await db.scalar(select(models.Song).where(models.Song.id == id))
 
     if song == None:
         raise HTTPException(
@@ -182,6 +360,11 @@ def delete_song(
             detail=f"Not authorized to perform requested action",
         )
 
-    song_query.delete(synchronize_session=False)
-    db.commit()
+    await db.execute(
+        delete(models.Song)
+        .where(models.Song.id == id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await response_cache.invalidate(f"song:{id}", f"artist:{song.artist_id}")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
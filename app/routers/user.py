@@ -1,16 +1,20 @@
-from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from .. import models, schemas, utils
+from fastapi import Response, status, HTTPException, Depends, APIRouter, Query
+from sqlalchemy import delete, exists, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, utils, oauth2, pagination, response_cache
+from .. import serialization
+from ..config import settings
 from ..database import get_db
-from typing import List
+from ..serialization import ORJSONResponse
+from typing import List, Optional
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    duplicate_email = (
-        db.query(models.User).filter(models.User.email == user.email).first()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    duplicate_email = await db.scalar(
+        select(models.User).where(models.User.email == user.email)
     )
     if duplicate_email:
         raise HTTPException(
@@ -18,18 +22,60 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
             detail=f"User email: {user.email} already exists",
         )
 
-    hashed_password = utils.hash(user.password)
+    hashed_password = await utils.hash_async(user.password)
     user.password = hashed_password
     new_user = models.User(**user.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
+@router.get("/me/recommendations", response_model=List[schemas.SongScoreOut])
+async def get_recommendations(
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Songs similar to the recent likes of the current user that they have not liked,
+    score sums the similarity to each of those likes
+    """
+    seeds = (
+        select(models.Like.song_id)
+        .where(models.Like.created_by == current_user.id)
+        .order_by(models.Like.created_at.desc())
+        .limit(settings.recommendations_seed_likes)
+        .subquery()
+    )
+    neighbor = models.SongNeighbor
+    already_liked = exists().where(
+        models.Like.created_by == current_user.id,
+        models.Like.song_id == neighbor.neighbor_id,
+    )
+    scores = (
+        select(neighbor.neighbor_id, func.sum(neighbor.score).label("score"))
+        .join(seeds, seeds.c.song_id == neighbor.song_id)
+        .where(~already_liked)
+        .group_by(neighbor.neighbor_id)
+        .order_by(func.sum(neighbor.score).desc(), neighbor.neighbor_id)
+        .limit(limit)
+        .subquery()
+    )
+    song_fields = list(schemas.Song.__fields__)
+    results = await db.execute(
+        select(*serialization.columns(schemas.Song, models.Song), scores.c.score)
+        .join(scores, scores.c.neighbor_id == models.Song.id)
+        .order_by(scores.c.score.desc(), models.Song.id)
+    )
+    return ORJSONResponse(
+        [{"Song": dict(zip(song_fields, row)), "score": row.score} for row in results]
+    )
+
+
 @router.get("/{id}", response_model=schemas.UserOut)
-def get_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def get_user(id: int, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.id == id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -39,11 +85,91 @@ def get_user(id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/", response_model=List[schemas.UserOut])
-def get_useres(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
-    if not users:
+async def get_useres(
+    db: AsyncSession = Depends(get_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Pages of users by id, pass the X-Next-Cursor header back as cursor for the next
+    fields (e.g. id,email) selects only those columns
+    """
+    names = serialization.field_names(schemas.UserOut, fields)
+    user_query = (
+        select(*serialization.columns(schemas.UserOut, models.User, {*names, "id"}))
+        .order_by(models.User.id)
+        .limit(limit)
+    )
+    if cursor is not None:
+        (last_id,) = pagination.decode_cursor(cursor, int)
+        user_query = user_query.where(models.User.id > last_id)
+    users = (await db.execute(user_query)).all()
+
+    headers = {}
+    if len(users) == limit:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(users[-1].id)
+    if not users and cursor is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No users available to retreive",
         )
-    return users
+    return ORJSONResponse(serialization.rows(users, names), headers=headers)
+
+
+@router.put("/{id}/password", status_code=status.HTTP_202_ACCEPTED)
+async def update_password(
+    id: int,
+    passwords: schemas.PasswordUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Change own password, the current password is required"""
+    if id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not authorized to perform requested action",
+        )
+
+    user = await db.scalar(select(models.User).where(models.User.id == id))
+    valid, _ = await utils.verify_and_update_async(passwords.password, user.password)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials"
+        )
+
+    hashed_password = await utils.hash_async(passwords.new_password)
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == id)
+        .values(password=hashed_password)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await oauth2.invalidate_user(id)
+    return {"message": f"Password updated for user {id}"}
+
+
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_user(
+    id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Delete own user account along with everything it created"""
+    if id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not authorized to perform requested action",
+        )
+
+    await db.execute(
+        delete(models.User)
+        .where(models.User.id == id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await oauth2.invalidate_user(id)
+    # Everything the user created is gone, and with their likes the like counts changed
+    await response_cache.invalidate(response_cache.EVERYTHING)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,8 +1,7 @@
-from sqlite3 import Time
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Union
 from datetime import datetime, time
-from pydantic.types import conint
+from pydantic.types import conint, conlist
 
 """ Base Schemas """
 
@@ -13,10 +12,15 @@ class Token(BaseModel):
 
 
 class TokenData(BaseModel):
-    id: str
+    id: int
     username: str
 
 
+class CurrentUser(BaseModel):
+    id: int
+    email: str
+
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -32,6 +36,15 @@ class PlaylistSongs(BaseModel):
     song_id: int
 
 
+class PlaylistSongsBatch(BaseModel):
+    add: conlist(int, max_items=1000) = []
+    remove: conlist(int, max_items=1000) = []
+
+
+class PlaylistSongsOrder(BaseModel):
+    song_ids: conlist(int, max_items=10000)
+
+
 class PlaylistBase(BaseModel):
     name: str
     private: bool = True
@@ -77,6 +90,11 @@ class UserCreate(BaseModel):
     password: str
 
 
+class PasswordUpdate(BaseModel):
+    password: str
+    new_password: str
+
+
 class ArtistCreate(BaseModel):
     name: str
 
@@ -90,9 +108,9 @@ class PlaylistUpdate(PlaylistBase):
 
 class SongUpdate(BaseModel):
     title: Optional[str]
-    genre_id: Optional[str]
+    genre_id: Optional[int]
     artist_id: Optional[int]
-    length: Optional[Time]
+    length: Optional[time]
 
 
 """ Return Schemas """
@@ -178,6 +196,11 @@ class SongsOut(BaseModel):
         orm_mode = True
 
 
+class SongScoreOut(BaseModel):
+    Song: Song
+    score: float
+
+
 class SongGet(BaseModel):
     id: int
     title: str
@@ -203,6 +226,26 @@ class PlaylistSongsOut(BaseModel):
         orm_mode = True
 
 
+class PlaylistTrack(BaseModel):
+    position: int
+    id: int
+    title: str
+    length: Optional[time]
+    artist_id: int
+    artist: str
+    genre_id: Optional[int]
+    genre: Optional[str]
+    like_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class PlaylistSongsBatchOut(BaseModel):
+    added: List[int]
+    removed: List[int]
+
+
 class PlaylistOut(BaseModel):
     id: int
     name: str
@@ -216,6 +259,25 @@ class PlaylistOut(BaseModel):
         orm_mode = True
 
 
+class BulkImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class BulkImportOut(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkImportError]
+    errors_truncated: bool
+
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    name: str
+    score: float
+
+
 class UserOut(BaseModel):
     id: int
     email: EmailStr
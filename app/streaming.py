@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+""" Responses streamed from a server side cursor, one partition at a time """
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+async def json_chunks(result):
+    """A JSON array of row objects"""
+    yield "["
+    separator = ""
+    async for partition in result.partitions():
+        yield separator + ",".join(
+            json.dumps(row._asdict(), default=str) for row in partition
+        )
+        separator = ","
+    yield "]"
+
+
+async def ndjson_chunks(result):
+    """One JSON object per row and line"""
+    async for partition in result.partitions():
+        yield "".join(
+            json.dumps(row._asdict(), default=str) + "\n" for row in partition
+        )
+
+
+async def csv_chunks(result):
+    """A header row of column names followed by one row per record"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    async for partition in result.partitions():
+        writer.writerows(partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+CHUNKS = {"json": json_chunks, "ndjson": ndjson_chunks, "csv": csv_chunks}
+
+
+def check_format(format: str) -> str:
+    if format not in CHUNKS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of: {', '.join(CHUNKS)}",
+        )
+    return format
+
+
+def stream_result(result, format: str, filename: str = None) -> StreamingResponse:
+    """Response that serializes result (from db.stream) while it is read"""
+    headers = {}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return StreamingResponse(
+        CHUNKS[format](result), media_type=MEDIA_TYPES[format], headers=headers
+    )
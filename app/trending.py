@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from fastapi import HTTPException, status
+from sqlalchemy import Integer, column, func, select, table, text, update
+from . import database
+from .config import settings
+
+""" Most liked songs per period, served from the trending_songs materialized view """
+
+logger = logging.getLogger(__name__)
+
+# Periods built by the view, see migration b5e4d1c2a9f3
+PERIODS = ("day", "week", "month")
+# pg_try_advisory_xact_lock key, one refresh at a time across workers
+REFRESH_LOCK = 7_234_519
+
+trending_songs = table(
+    "trending_songs",
+    column("period"),
+    column("song_id", Integer),
+    column("genre_id", Integer),
+    column("likes", Integer),
+)
+
+# One row holding the time of the last refresh, kept out of the view so that a
+# concurrent refresh only rewrites the rows whose counts changed
+trending_refresh = table("trending_refresh", column("refreshed_at"))
+
+
+def check_period(period: str):
+    if period not in PERIODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"window must be one of: {', '.join(PERIODS)}",
+        )
+
+
+async def refresh(db, max_age: float = 0) -> bool:
+    """
+    Rebuilds trending_songs unless it is younger than max_age seconds or another
+    worker holds the refresh lock, returns whether it did
+    """
+    age = await db.scalar(
+        select(func.extract("epoch", func.now() - trending_refresh.c.refreshed_at))
+    )
+    if age is not None and age < max_age:
+        return False
+    if not await db.scalar(select(func.pg_try_advisory_xact_lock(REFRESH_LOCK))):
+        await db.rollback()
+        return False
+    # Readers keep the previous rows until the commit
+    await db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY trending_songs"))
+    await db.execute(update(trending_refresh).values(refreshed_at=func.now()))
+    await db.commit()
+    return True
+
+
+async def run(interval: float):
+    while True:
+        try:
+            async with database.session_scope() as db:
+                await refresh(db, max_age=interval)
+        except Exception:
+            logger.exception("Refreshing trending_songs failed")
+        await asyncio.sleep(interval)
+
+
+_task = None
+
+
+def start():
+    """Refreshes the view every trending_refresh_seconds while the app runs"""
+    global _task
+    if _task is None and settings.trending_refresh_seconds > 0:
+        _task = asyncio.create_task(run(settings.trending_refresh_seconds))
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -1,10 +1,18 @@
-from fastapi import Depends, HTTPException, status
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
-from . import models
-from sqlalchemy.orm import Session
-from .database import get_db
+from .config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes below bcrypt_rounds verify fine but are flagged for rehashing
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+)
 
 
 def hash(password: str):
@@ -13,3 +21,96 @@ def hash(password: str):
 
 def verify(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update(plain_password, hashed_password):
+    """Returns (valid, new_hash), new_hash is set when the stored cost is outdated"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+""" bcrypt worker processes, keeps password hashing off the event loop and the GIL """
+
+_hash_pool = None
+_hash_pending = 0
+
+
+def hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+def discard_hash_pool(pool: ProcessPoolExecutor):
+    """Drops a pool broken by a dead worker, the next call starts a new one"""
+    global _hash_pool
+    if _hash_pool is pool:
+        _hash_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def hash_pool_unavailable(detail: str):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": "1"},
+    )
+
+
+def release_hash_slot(future: asyncio.Future):
+    global _hash_pending
+    _hash_pending -= 1
+    # Nobody awaits the result of a call whose request went away
+    if not future.cancelled():
+        future.exception()
+
+
+async def run_in_hash_pool(func, *args):
+    """
+    Runs func in the hash pool, 503 once every worker and queue slot is taken or
+    when a worker died. A call holds its slot until the pool is done with it,
+    also when the request that made it is cancelled
+    """
+    global _hash_pending
+    limit = settings.password_hash_workers + settings.password_hash_queue_size
+    if _hash_pending >= limit:
+        raise hash_pool_unavailable(
+            "Too many concurrent password operations, retry shortly"
+        )
+
+    pool = hash_pool()
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        discard_hash_pool(pool)
+        raise hash_pool_unavailable("Password hashing restarted, retry shortly")
+    _hash_pending += 1
+    result = asyncio.wrap_future(future)
+    result.add_done_callback(release_hash_slot)
+    try:
+        return await asyncio.shield(result)
+    except asyncio.CancelledError:
+        # Frees the slot now if the call has not started, else when it ends
+        future.cancel()
+        raise
+    except BrokenProcessPool:
+        discard_hash_pool(pool)
+        raise hash_pool_unavailable("Password hashing restarted, retry shortly")
+
+
+async def hash_async(password: str):
+    return await run_in_hash_pool(hash, password)
+
+
+async def verify_and_update_async(plain_password, hashed_password):
+    return await run_in_hash_pool(verify_and_update, plain_password, hashed_password)
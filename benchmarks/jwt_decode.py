@@ -0,0 +1,57 @@
+"""
+Microbenchmark of bearer token verification cost per request
+
+    python -m benchmarks.jwt_decode [--number 20000]
+
+Compares a full python-jose decode (the previous per-request cost), a PyJWT
+decode, and verify_access_token answering from the verified token cache.
+Runs without a .env, no database connection is made.
+"""
+import argparse
+import os
+import timeit
+
+for name, value in {
+    "DATABASE_HOSTNAME": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_PASSWORD": "",
+    "DATABASE_NAME": "benchmark",
+    "DATABASE_USERNAME": "benchmark",
+    "SECRET_KEY": "benchmark-secret-key-of-at-least-32-bytes",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}.items():
+    os.environ.setdefault(name, value)
+
+from app import jwt_backends, oauth2  # noqa: E402
+
+
+def per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = oauth2.create_access_token(data={"user_id": 1, "username": "a@b.com"})
+    jose = jwt_backends.JoseBackend(oauth2.SECRET_KEY, oauth2.ALGORITHM)
+    pyjwt = jwt_backends.PyJWTBackend(oauth2.SECRET_KEY, oauth2.ALGORITHM)
+    error = oauth2.get_credentials_exception()
+    oauth2.verify_access_token(token, error)
+
+    results = {
+        "jose decode (before)": per_call_us(lambda: jose.decode(token), args.number),
+        "pyjwt decode": per_call_us(lambda: pyjwt.decode(token), args.number),
+        "verify_access_token cached": per_call_us(
+            lambda: oauth2.verify_access_token(token, error), args.number
+        ),
+    }
+    baseline = results["jose decode (before)"]
+    for name, microseconds in results.items():
+        print(f"{name:30} {microseconds:8.2f} us/request {baseline / microseconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Commits per like tap, written one by one (before) against write-behind batching
+
+    python -m benchmarks.like_ingestion [--users 20] [--songs 50]
+
+Every user likes then unlikes every song through the TestClient against the
+database in .env, once per mode, counting the commits and taps per second.
+Creates its own users, artist and songs and deletes them again.
+"""
+import argparse
+import time
+import uuid
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event
+from app import database, like_buffer, models, utils
+from app.config import settings
+from app.main import app
+
+
+class CommitCounter:
+    def __init__(self):
+        self.count = 0
+        engines = [database.engine]
+        if settings.database_async:
+            engines.append(database.async_engine.sync_engine)
+        for engine in engines:
+            event.listen(engine, "commit", self.commit)
+
+    def commit(self, conn):
+        self.count += 1
+
+
+def seed(users: int, songs: int):
+    name = uuid.uuid4().hex[:12]
+    with database.SessionLocal() as db:
+        password = utils.hash("pw")
+        user_rows = [
+            models.User(email=f"{name}-{i}@like-ingestion.test", password=password)
+            for i in range(users)
+        ]
+        genre = models.Genre(genre=name)
+        db.add_all([*user_rows, genre])
+        db.flush()
+        artist = models.Artist(name=name, created_by=user_rows[0].id)
+        db.add(artist)
+        db.flush()
+        song_rows = [
+            models.Song(
+                title=f"{name} {i}",
+                genre_id=genre.id,
+                artist_id=artist.id,
+                length="00:03:00",
+                created_by=user_rows[0].id,
+            )
+            for i in range(songs)
+        ]
+        db.add_all(song_rows)
+        db.commit()
+        return genre.id, [u.email for u in user_rows], [s.id for s in song_rows]
+
+
+def taps(client: TestClient, tokens: list, song_ids: list, counter: CommitCounter):
+    counter.count = 0
+    started = time.perf_counter()
+    count = 0
+    for dir in (1, 0):
+        for token in tokens:
+            headers = {"Authorization": f"Bearer {token}"}
+            for song_id in song_ids:
+                response = client.post(
+                    "/like/", json={"song_id": song_id, "dir": dir}, headers=headers
+                )
+                response.raise_for_status()
+                count += 1
+    client.portal.call(like_buffer.buffer.flush)
+    return count, counter.count, count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--songs", type=int, default=50)
+    args = parser.parse_args()
+
+    genre_id, emails, song_ids = seed(args.users, args.songs)
+    counter = CommitCounter()
+    # The flush loop starts with the app, only flushes of this run are counted
+    settings.like_write_behind = True
+    try:
+        with TestClient(app) as client:
+            tokens = [
+                client.post(
+                    "/login", data={"username": email, "password": "pw"}
+                ).json()["access_token"]
+                for email in emails
+            ]
+            results = {}
+            for name, write_behind in (
+                ("per tap (before)", False),
+                ("write-behind", True),
+            ):
+                settings.like_write_behind = write_behind
+                results[name] = taps(client, tokens, song_ids, counter)
+    finally:
+        with database.SessionLocal() as db:
+            db.execute(delete(models.User).where(models.User.email.in_(emails)))
+            db.execute(delete(models.Genre).where(models.Genre.id == genre_id))
+            db.commit()
+
+    for name, (count, commits, rate) in results.items():
+        print(f"{name:18} {count} taps {commits:6} commits {rate:8.1f} taps/s")
+
+
+if __name__ == "__main__":
+    main()
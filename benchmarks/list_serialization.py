@@ -0,0 +1,109 @@
+"""
+Requests per second of GET /songs/?limit=500, ORM rows through pydantic and
+JSONResponse (before) against column tuples through orjson (after)
+
+    python -m benchmarks.list_serialization [--seconds 5] [--seed]
+
+The before handler is the previous get_songs, mounted next to the app for the
+run only. Both run through the TestClient against the database in .env and
+must return identical JSON. --seed inserts songs under a benchmark user when
+the database has fewer than 500.
+"""
+import argparse
+import time
+import uuid
+from datetime import time as song_length
+from fastapi import Depends
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from app import database, models, schemas
+from app.main import app
+
+LIMIT = 500
+BEFORE_PATH = "/benchmark/songs-before/"
+
+
+@app.get(
+    BEFORE_PATH,
+    response_model=List[schemas.SongsOut],
+    response_class=JSONResponse,
+    include_in_schema=False,
+)
+async def get_songs_before(
+    db: AsyncSession = Depends(database.get_db), limit: int = 20, skip: int = 0
+):
+    song_query = select(models.Song, models.Song.like_count.label("likes"))
+    song_query = song_query.order_by(models.Song.id).offset(skip)
+    return (await db.execute(song_query.limit(limit))).all()
+
+
+def seed(count: int):
+    with database.SessionLocal() as db:
+        missing = count - db.scalar(select(func.count(models.Song.id)))
+        if missing <= 0:
+            return
+        name = uuid.uuid4().hex[:12]
+        user = models.User(email=f"{name}@list-serialization.test", password="-")
+        genre = models.Genre(genre=name)
+        db.add_all([user, genre])
+        db.flush()
+        artist = models.Artist(name=name, created_by=user.id)
+        db.add(artist)
+        db.flush()
+        db.add_all(
+            models.Song(
+                title=f"{name} {i}",
+                genre_id=genre.id,
+                artist_id=artist.id,
+                length=song_length(0, 3, i % 60),
+                created_by=user.id,
+            )
+            for i in range(missing)
+        )
+        db.commit()
+        print(f"seeded {missing} songs")
+
+
+def requests_per_second(client: TestClient, path: str, seconds: float) -> float:
+    params = {"limit": LIMIT}
+    client.get(path, params=params)
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        response = client.get(path, params=params)
+        response.raise_for_status()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--seed", action="store_true")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(LIMIT)
+    with TestClient(app) as client:
+        before = client.get(BEFORE_PATH, params={"limit": LIMIT}).json()
+        after = client.get("/songs/", params={"limit": LIMIT}).json()
+        if before != after:
+            raise SystemExit("responses differ between before and after")
+        print(f"{len(after)} songs per response")
+
+        results = {
+            "pydantic + json (before)": requests_per_second(
+                client, BEFORE_PATH, args.seconds
+            ),
+            "columns + orjson": requests_per_second(client, "/songs/", args.seconds),
+        }
+    baseline = results["pydantic + json (before)"]
+    for name, rate in results.items():
+        print(f"{name:26} {rate:8.1f} req/s {rate / baseline:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,761 @@
+"""
+Latency percentiles and throughput of every route under a concurrent mix
+
+    python -m benchmarks.load_test [--transport asgi|http] [--url URL]
+        [--workers 1] [--concurrency 16] [--duration 30] [--scenarios N]
+        [--seed 1] [--output report.json]
+        [--baseline report.json] [--max-regression 0.25]
+
+Runs against the catalog of benchmarks.seed_catalog in the database in .env.
+asgi calls the app in this process, http sends real requests to --url or to
+uvicorn started on a free port with --workers processes. Every scenario runs
+once to warm up, which must reach every route, then concurrency clients pick
+weighted SCENARIOS until duration seconds have passed or N scenarios ran.
+A server given by --url needs ADMIN_EMAILS to hold the first seeded user for
+the admin routes and /metrics, started servers get it.
+
+Prints, and writes to --output, a JSON report of p50/p95/p99 latency in ms,
+requests per second and errors per route. With --baseline, a previous report,
+exits 1 when the total throughput or the p95 of a route with MIN_SAMPLES calls
+got worse by more than max-regression. Write scenarios delete what they create.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.routing import APIRoute
+from sqlalchemy import text
+from urllib.parse import urlencode
+from app import database
+from app.main import app
+from .seed_catalog import PASSWORD
+
+# Seeded users logged in before the run, each request picks one of them
+LOGINS = 50
+# Routes called fewer times are reported but not compared with the baseline
+MIN_SAMPLES = 20
+# Unexpected responses kept per route in the report
+ERROR_SAMPLES = 3
+
+
+class Response:
+    def __init__(self, status_code: int, headers: dict, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ASGITransport:
+    """Calls the app in this process, lifespan included, without a socket"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, path, params, headers, body) -> Response:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": urlencode(params or {}, doseq=True).encode(),
+            "headers": [(b"host", b"loadtest")]
+            + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("loadtest", 80),
+        }
+        finished = asyncio.Event()
+        received = False
+        status_code, response_headers, chunks = None, {}, []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for key, value in message.get("headers", []):
+                    response_headers[key.decode().lower()] = value.decode()
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    finished.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return Response(status_code, response_headers, b"".join(chunks))
+
+    async def start(self):
+        self.lifespan_receive = asyncio.Queue()
+        self.lifespan_send = asyncio.Queue()
+        self.lifespan = asyncio.create_task(
+            self.app(
+                {"type": "lifespan", "asgi": {"version": "3.0"}},
+                self.lifespan_receive.get,
+                self.lifespan_send.put,
+            )
+        )
+        await self.lifespan_receive.put({"type": "lifespan.startup"})
+        message = await self.lifespan_send.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise SystemExit(f"app startup failed: {message.get('message')}")
+
+    async def stop(self):
+        await self.lifespan_receive.put({"type": "lifespan.shutdown"})
+        await self.lifespan_send.get()
+        await self.lifespan
+
+
+class HTTPTransport:
+    """Requests to a server at url, one keep-alive session per thread"""
+
+    def __init__(self, url: str, concurrency: int):
+        import requests
+
+        self.session_class = requests.Session
+        self.url = url.rstrip("/")
+        self.executor = ThreadPoolExecutor(concurrency)
+        self.local = threading.local()
+
+    def send(self, method, path, params, headers, body) -> Response:
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.session_class()
+        response = session.request(
+            method, self.url + path, params=params, headers=headers, data=body
+        )
+        return Response(
+            response.status_code,
+            {k.lower(): v for k, v in response.headers.items()},
+            response.content,
+        )
+
+    async def request(self, method, path, params, headers, body) -> Response:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.send, method, path, params, headers, body
+        )
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.executor.shutdown()
+
+
+class UnexpectedResponse(Exception):
+    pass
+
+
+class Recorder:
+    """Latencies and errors per "METHOD /route", e.g. GET /songs/{id}"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+        self.started = time.perf_counter()
+
+    def add(self, route: str, seconds: float, error: str = None):
+        self.latencies[route].append(seconds)
+        if error is not None:
+            self.errors[route] += 1
+            if len(self.error_samples[route]) < ERROR_SAMPLES:
+                self.error_samples[route].append(error)
+
+
+class Client:
+    def __init__(self, transport, recorder: Recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    async def call(
+        self,
+        method: str,
+        route: str,
+        expected=200,
+        params: dict = None,
+        json_body=None,
+        form: dict = None,
+        body: bytes = b"",
+        headers: dict = None,
+        **path_params,
+    ) -> Response:
+        """
+        Calls "METHOD route" with path params from path_params, raises
+        UnexpectedResponse unless the status is expected (an int or a tuple)
+        """
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            body = urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        path = route.format(**path_params)
+        started = time.perf_counter()
+        response = await self.transport.request(method, path, params, headers, body)
+        seconds = time.perf_counter() - started
+
+        expected = expected if isinstance(expected, tuple) else (expected,)
+        key = f"{method} {route}"
+        if response.status_code in expected:
+            self.recorder.add(key, seconds)
+            return response
+        error = (
+            f"{response.status_code} {response.content[:200].decode(errors='replace')}"
+        )
+        self.recorder.add(key, seconds, error)
+        raise UnexpectedResponse(f"{key} {path}: {error}")
+
+
+class Catalog:
+    """Ids of the seeded catalog, and logged in users, that scenarios pick from"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        with database.engine.connect() as conn:
+
+            def ids(statement: str) -> list:
+                return conn.execute(text(statement)).scalars().all()
+
+            self.users = conn.execute(
+                text(
+                    "SELECT id, email FROM users WHERE email LIKE 'load-%@load.test' "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"limit": LOGINS},
+            ).all()
+            self.user_ids = ids(
+                "SELECT id FROM users WHERE email LIKE 'load-%@load.test'"
+            )
+            self.genre_ids = ids(
+                "SELECT id FROM genres WHERE genre LIKE 'load-genre-%' ORDER BY id"
+            )
+            self.artist_ids = ids(
+                "SELECT id FROM artists WHERE name LIKE 'load-artist-%' ORDER BY id"
+            )
+            self.song_ids = ids(
+                "SELECT id FROM songs WHERE title LIKE 'load-song-%' ORDER BY id"
+            )
+            self.playlist_ids = ids(
+                "SELECT id FROM playlists WHERE name LIKE 'load-playlist-%' "
+                "AND NOT private ORDER BY id"
+            )
+        if not (self.users and self.song_ids and self.playlist_ids):
+            raise SystemExit("No load catalog, run python -m benchmarks.seed_catalog")
+        self.sessions = []
+
+    async def login(self, client: Client):
+        for user_id, email in self.users:
+            token = (
+                await client.call(
+                    "POST", "/login", form={"username": email, "password": PASSWORD}
+                )
+            ).json()["access_token"]
+            self.sessions.append((user_id, {"Authorization": f"Bearer {token}"}))
+
+    def session(self):
+        return self.rng.choice(self.sessions)
+
+    def popular_song(self) -> int:
+        # Most reads go to the head of the catalog, like the seeded likes
+        return self.song_ids[int(self.rng.random() ** 3 * len(self.song_ids))]
+
+
+def unique_name() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+""" Scenarios, each calls one or more routes as one user would """
+
+
+async def browse_songs(client: Client, catalog: Catalog):
+    params = {"limit": catalog.rng.choice((20, 100))}
+    if catalog.rng.random() < 0.5:
+        params["genre_id"] = catalog.rng.choice(catalog.genre_ids)
+    response = await client.call("GET", "/songs/", params=params)
+    cursor = response.headers.get("x-next-cursor")
+    if cursor:
+        await client.call("GET", "/songs/", params={**params, "cursor": cursor})
+
+
+async def view_song(client: Client, catalog: Catalog):
+    await client.call("GET", "/songs/{id}", id=catalog.popular_song())
+
+
+async def trending(client: Client, catalog: Catalog):
+    params = {"window": catalog.rng.choice(("day", "week", "month"))}
+    if catalog.rng.random() < 0.3:
+        params["genre_id"] = catalog.rng.choice(catalog.genre_ids)
+    await client.call("GET", "/songs/trending", params=params)
+
+
+async def similar_songs(client: Client, catalog: Catalog):
+    await client.call("GET", "/songs/{id}/similar", id=catalog.popular_song())
+
+
+async def recommendations(client: Client, catalog: Catalog):
+    _, headers = catalog.session()
+    await client.call("GET", "/users/me/recommendations", headers=headers)
+
+
+async def browse_artists(client: Client, catalog: Catalog):
+    await client.call("GET", "/artists/", params={"skip": catalog.rng.randrange(500)})
+    await client.call("GET", "/artists/{id}", id=catalog.rng.choice(catalog.artist_ids))
+
+
+async def browse_genres(client: Client, catalog: Catalog):
+    await client.call("GET", "/genres/")
+
+
+async def browse_playlists(client: Client, catalog: Catalog):
+    _, headers = catalog.session()
+    await client.call("GET", "/playlists/", headers=headers)
+    playlist_id = catalog.rng.choice(catalog.playlist_ids)
+    await client.call("GET", "/playlists/{id}", id=playlist_id)
+    response = await client.call(
+        "GET", "/playlist-songs/{id}", id=playlist_id, headers=headers
+    )
+    cursor = response.headers.get("x-next-cursor")
+    if cursor:
+        await client.call(
+            "GET",
+            "/playlist-songs/{id}",
+            id=playlist_id,
+            params={"cursor": cursor},
+            headers=headers,
+        )
+
+
+async def browse_users(client: Client, catalog: Catalog):
+    await client.call("GET", "/users/")
+    await client.call("GET", "/users/{id}", id=catalog.rng.choice(catalog.user_ids))
+
+
+async def search(client: Client, catalog: Catalog):
+    kind = catalog.rng.choice(("song", "artist", "playlist"))
+    await client.call(
+        "GET", "/search/", params={"q": f"load-{kind}-{catalog.rng.randrange(1000)}"}
+    )
+
+
+async def like(client: Client, catalog: Catalog):
+    """Likes a song, or unlikes it when the user already did"""
+    _, headers = catalog.session()
+    song_id = catalog.popular_song()
+    response = await client.call(
+        "POST",
+        "/like/",
+        (201, 409),
+        json_body={"song_id": song_id, "dir": 1},
+        headers=headers,
+    )
+    if response.status_code == 409:
+        await client.call(
+            "POST",
+            "/like/",
+            (201, 204),
+            json_body={"song_id": song_id, "dir": 0},
+            headers=headers,
+        )
+
+
+async def edit_playlist(client: Client, catalog: Catalog):
+    _, headers = catalog.session()
+    playlist = {"name": f"load-playlist-{unique_name()}", "private": True, "desc": None}
+    playlist_id = (
+        await client.call(
+            "POST", "/playlists/", 201, json_body=playlist, headers=headers
+        )
+    ).json()["id"]
+    try:
+        await client.call(
+            "PUT",
+            "/playlists/{id}",
+            202,
+            id=playlist_id,
+            json_body={**playlist, "desc": "edited"},
+            headers=headers,
+        )
+        song_ids = list(dict.fromkeys(catalog.popular_song() for _ in range(20)))
+        await client.call(
+            "POST",
+            "/playlist-songs/",
+            201,
+            json_body={"playlist_id": playlist_id, "song_id": song_ids[0]},
+            headers=headers,
+        )
+        await client.call(
+            "POST",
+            "/playlist-songs/{playlist_id}/batch",
+            playlist_id=playlist_id,
+            json_body={"add": song_ids[1:]},
+            headers=headers,
+        )
+        await client.call(
+            "PUT",
+            "/playlist-songs/{playlist_id}/order",
+            204,
+            playlist_id=playlist_id,
+            json_body={"song_ids": song_ids[::-1]},
+            headers=headers,
+        )
+        await client.call(
+            "DELETE",
+            "/playlist-songs/{playlist_id}/{song_id}",
+            204,
+            playlist_id=playlist_id,
+            song_id=song_ids[0],
+            headers=headers,
+        )
+    finally:
+        await client.call(
+            "DELETE", "/playlists/{id}", 204, id=playlist_id, headers=headers
+        )
+
+
+async def publish_songs(client: Client, catalog: Catalog):
+    _, headers = catalog.session()
+    name = unique_name()
+    artist_id = (
+        await client.call(
+            "POST",
+            "/artists/",
+            201,
+            json_body={"name": f"load-artist-{name}"},
+            headers=headers,
+        )
+    ).json()["id"]
+    try:
+        await client.call(
+            "PUT",
+            "/artists/{id}",
+            202,
+            id=artist_id,
+            json_body={"name": f"load-artist-{name}-edited"},
+            headers=headers,
+        )
+        song = {
+            "genre_id": catalog.rng.choice(catalog.genre_ids),
+            "artist_id": artist_id,
+            "length": "00:03:30",
+        }
+        song_id = (
+            await client.call(
+                "POST",
+                "/songs/",
+                json_body={"title": f"load-song-{name}", **song},
+                headers=headers,
+            )
+        ).json()["id"]
+        await client.call(
+            "PUT",
+            "/songs/{id}",
+            202,
+            id=song_id,
+            json_body={"title": f"load-song-{name}-edited", **song},
+            headers=headers,
+        )
+        await client.call(
+            "POST",
+            "/songs/bulk",
+            201,
+            body="\n".join(
+                json.dumps({"title": f"load-song-{name}-{i}", **song})
+                for i in range(50)
+            ).encode(),
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+        )
+        await client.call("DELETE", "/songs/{id}", 204, id=song_id, headers=headers)
+    finally:
+        # Takes the bulk imported songs with it
+        await client.call("DELETE", "/artists/{id}", 204, id=artist_id, headers=headers)
+
+
+async def add_genre(client: Client, catalog: Catalog):
+    # Genres have no delete route, seed_catalog --delete removes these
+    await client.call(
+        "POST", "/genres/", json_body={"genre_id": f"load-genre-{unique_name()}"}
+    )
+
+
+async def sign_up(client: Client, catalog: Catalog):
+    email = f"load-{unique_name()}@load.test"
+    credentials = {"email": email, "password": PASSWORD}
+    user_id = (await client.call("POST", "/users/", 201, json_body=credentials)).json()[
+        "id"
+    ]
+    token = (
+        await client.call(
+            "POST", "/login", form={"username": email, "password": PASSWORD}
+        )
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        await client.call(
+            "PUT",
+            "/users/{id}/password",
+            202,
+            id=user_id,
+            json_body={"password": PASSWORD, "new_password": PASSWORD},
+            headers=headers,
+        )
+    finally:
+        await client.call("DELETE", "/users/{id}", 204, id=user_id, headers=headers)
+
+
+async def monitoring(client: Client, catalog: Catalog):
+    await client.call("GET", "/")
+    # An admin, see admin_export
+    await client.call("GET", "/metrics", headers=catalog.sessions[0][1])
+
+
+async def admin_export(client: Client, catalog: Catalog):
+    # The first seeded user is made an admin, see main()
+    headers = catalog.sessions[0][1]
+    await client.call(
+        "GET", "/admin/export/users", params={"format": "csv"}, headers=headers
+    )
+    await client.call("GET", "/admin/export/playlists", headers=headers)
+
+
+# (scenario, relative weight), a read heavy mix with a tail of writes
+SCENARIOS = [
+    (browse_songs, 15),
+    (view_song, 20),
+    (trending, 8),
+    (similar_songs, 6),
+    (recommendations, 4),
+    (browse_artists, 8),
+    (browse_genres, 3),
+    (browse_playlists, 8),
+    (browse_users, 2),
+    (search, 6),
+    (like, 12),
+    (edit_playlist, 2),
+    (publish_songs, 1),
+    (add_genre, 0.1),
+    (sign_up, 0.5),
+    (monitoring, 0.5),
+    (admin_export, 0.05),
+]
+
+
+async def worker(client: Client, catalog: Catalog, deadline: float, budget: list):
+    scenarios, weights = zip(*SCENARIOS)
+    while time.perf_counter() < deadline and budget[0] > 0:
+        scenario = catalog.rng.choices(scenarios, weights)[0]
+        try:
+            await scenario(client, catalog)
+        except UnexpectedResponse:
+            # Recorded against the route, the rest of the scenario is skipped
+            pass
+        budget[0] -= 1
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    index = max(0, math.ceil(fraction * len(values)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def report(recorder: Recorder, elapsed: float, args) -> dict:
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[route],
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+        if recorder.error_samples[route]:
+            routes[route]["error_samples"] = recorder.error_samples[route]
+    requests = sum(route["requests"] for route in routes.values())
+    return {
+        "transport": args.transport,
+        "workers": args.workers if args.transport == "http" and not args.url else None,
+        "database_async": database.settings.database_async,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": requests,
+        "errors": sum(route["errors"] for route in routes.values()),
+        "rps": round(requests / elapsed, 2),
+        "routes": routes,
+    }
+
+
+def regressions(current: dict, baseline: dict, max_regression: float) -> list:
+    found = []
+    if current["rps"] < baseline["rps"] * (1 - max_regression):
+        found.append(f"throughput {baseline['rps']} -> {current['rps']} req/s")
+    for route, stats in current["routes"].items():
+        before = baseline["routes"].get(route)
+        if before is None or min(stats["requests"], before["requests"]) < MIN_SAMPLES:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            found.append(f"{route} p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+    return found
+
+
+def app_routes(app) -> set:
+    return {
+        f"{method} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, admin_email: str):
+    """uvicorn serving app.main:app on a free port, and its url once it answers"""
+    import requests
+
+    port = free_port()
+    env = {**os.environ, "ADMIN_EMAILS": json.dumps([admin_email])}
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"uvicorn exited with {server.returncode}")
+        try:
+            requests.get(url + "/", timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("uvicorn did not start in 60s")
+
+
+async def run(transport, catalog: Catalog, args) -> dict:
+    recorder = Recorder()
+    client = Client(transport, recorder)
+    await transport.start()
+    try:
+        await catalog.login(client)
+        for scenario, _ in SCENARIOS:
+            await scenario(client, catalog)
+        missing = app_routes(app) - recorder.latencies.keys()
+        if missing:
+            raise SystemExit(f"Scenarios miss routes: {', '.join(sorted(missing))}")
+
+        recorder.reset()
+        deadline = time.perf_counter() + args.duration
+        budget = [args.scenarios or float("inf")]
+        await asyncio.gather(
+            *(
+                worker(client, catalog, deadline, budget)
+                for _ in range(args.concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - recorder.started
+    finally:
+        await transport.stop()
+    return report(recorder, elapsed, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transport", choices=("asgi", "http"), default="asgi")
+    parser.add_argument("--url", help="server to test, uvicorn is started without it")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument(
+        "--scenarios", type=int, default=0, help="stop after N scenarios instead"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="seeds the mix")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+    if args.scenarios:
+        args.duration = float("inf")
+
+    catalog = Catalog(random.Random(args.seed))
+    admin_email = catalog.users[0][1]
+    server = None
+    if args.transport == "asgi":
+        database.settings.admin_emails.append(admin_email)
+        transport = ASGITransport(app)
+    else:
+        url = args.url
+        if url is None:
+            server, url = start_server(args.workers, admin_email)
+        transport = HTTPTransport(url, args.concurrency)
+
+    try:
+        result = asyncio.run(run(transport, catalog, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            result["regressions"] = regressions(
+                result, json.load(file), args.max_regression
+            )
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    return 1 if result.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
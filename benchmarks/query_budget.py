@@ -0,0 +1,261 @@
+"""
+Fails when a route issues more SQL statements than its budget
+
+    python -m benchmarks.query_budget [--verbose]
+
+Calls every route under app/routers/ once through the TestClient against the
+database in .env, counting the statements sent by both engines, and exits 1
+if any route goes over its entry in BUDGETS or has no entry at all. The
+current user is dropped from the principal cache before each call so
+authenticated routes are counted cold. Creates its own user, artist, songs
+and playlists, and deletes them again through the API.
+"""
+import argparse
+import sys
+import uuid
+from collections import defaultdict
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import database, models, oauth2
+from app.main import app
+
+# Most statements one call of "METHOD /path" may issue, including the
+# principal lookup of get_current_user. Cached reads count their miss path,
+# validator query included
+BUDGETS = {
+    "POST /users/": 3,
+    "GET /users/{id}": 1,
+    "GET /users/": 1,
+    "PUT /users/{id}/password": 3,
+    "DELETE /users/{id}": 2,
+    "POST /login": 1,
+    "POST /genres/": 3,
+    "GET /genres/": 2,
+    "POST /artists/": 4,
+    "PUT /artists/{id}": 4,
+    "DELETE /artists/{id}": 4,
+    "GET /artists/": 1,
+    "GET /artists/{id}": 2,
+    "POST /songs/": 6,
+    "POST /songs/bulk": 4,
+    "PUT /songs/{id}": 4,
+    "GET /songs/": 1,
+    "GET /songs/{id}": 2,
+    "GET /songs/trending": 1,
+    "GET /songs/{id}/similar": 2,
+    "GET /users/me/recommendations": 2,
+    "DELETE /songs/{id}": 3,
+    "POST /like/": 4,
+    "POST /playlists/": 4,
+    "PUT /playlists/{id}": 4,
+    "DELETE /playlists/{id}": 3,
+    "GET /playlists/{id}": 1,
+    "GET /playlists/": 3,
+    "POST /playlist-songs/": 5,
+    "POST /playlist-songs/{playlist_id}/batch": 6,
+    "PUT /playlist-songs/{playlist_id}/order": 4,
+    "DELETE /playlist-songs/{playlist_id}/{song_id}": 4,
+    "GET /playlist-songs/{id}": 3,
+    "GET /search/": 3,
+    "GET /metrics": 1,
+    "GET /admin/export/users": 2,
+    "GET /admin/export/playlists": 2,
+}
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        engines = [database.engine]
+        if database.settings.database_async:
+            engines.append(database.async_engine.sync_engine)
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, *args):
+        self.count += 1
+        self.statements.append(statement)
+
+    def reset(self):
+        self.count = 0
+        self.statements = []
+
+
+class Scenario:
+    def __init__(self, client: TestClient, counter: StatementCounter):
+        self.client = client
+        self.counter = counter
+        self.counts = defaultdict(int)
+        self.statements = {}
+        self.user_id = None
+        self.headers = {}
+
+    def call(self, method: str, path: str, expected: int = 200, **kwargs):
+        """Calls the route "METHOD path", path params are taken from kwargs"""
+        params = {k: kwargs.pop(k) for k in list(kwargs) if "{" + k + "}" in path}
+        kwargs.setdefault("headers", self.headers)
+        if self.user_id is not None:
+            self.client.portal.call(oauth2.invalidate_user, self.user_id)
+
+        self.counter.reset()
+        response = self.client.request(method, path.format(**params), **kwargs)
+        route = f"{method} {path}"
+        if response.status_code != expected:
+            raise SystemExit(f"{route}: {response.status_code} {response.text}")
+
+        if self.counter.count >= self.counts[route]:
+            self.counts[route] = self.counter.count
+            self.statements[route] = self.counter.statements
+        return response
+
+    def run(self):
+        name = uuid.uuid4().hex[:12]
+        email = f"{name}@query-budget.test"
+        user = self.call(
+            "POST", "/users/", 201, json={"email": email, "password": "pw"}
+        ).json()
+        self.user_id = user["id"]
+        token = self.call(
+            "POST", "/login", data={"username": email, "password": "pw"}
+        ).json()["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+        self.call("GET", "/users/{id}", id=self.user_id)
+        self.call("GET", "/users/")
+        self.call(
+            "PUT",
+            "/users/{id}/password",
+            202,
+            id=self.user_id,
+            json={"password": "pw", "new_password": "pw"},
+        )
+
+        genre_id = self.call("POST", "/genres/", json={"genre_id": name}).json()["id"]
+        self.call("GET", "/genres/")
+
+        artist_id = self.call("POST", "/artists/", 201, json={"name": name}).json()[
+            "id"
+        ]
+        self.call("PUT", "/artists/{id}", 202, id=artist_id, json={"name": name})
+        self.call("GET", "/artists/", params={"name": name})
+
+        song = {"genre_id": genre_id, "artist_id": artist_id, "length": "00:03:00"}
+        song_ids = [
+            self.call("POST", "/songs/", json={"title": f"s{i}", **song}).json()["id"]
+            for i in range(3)
+        ]
+        self.call(
+            "POST",
+            "/songs/bulk",
+            201,
+            data="\n".join(
+                f'{{"title": "b{i}", "genre_id": {genre_id}, '
+                f'"artist_id": {artist_id}, "length": "00:03:00"}}'
+                for i in range(50)
+            ),
+            headers={**self.headers, "Content-Type": "application/x-ndjson"},
+        )
+        self.call(
+            "PUT", "/songs/{id}", 202, id=song_ids[0], json={"title": "s0", **song}
+        )
+        self.call("GET", "/songs/", params={"genre_id": genre_id})
+        self.call("GET", "/songs/{id}", id=song_ids[0])
+        self.call("GET", "/songs/trending", params={"genre_id": genre_id})
+        self.call("GET", "/songs/{id}/similar", id=song_ids[0])
+        self.call("GET", "/artists/{id}", id=artist_id)
+        self.call("POST", "/like/", 201, json={"song_id": song_ids[0], "dir": 1})
+        self.call("GET", "/users/me/recommendations")
+        self.call("POST", "/like/", 204, json={"song_id": song_ids[0], "dir": 0})
+
+        playlist = {"name": name, "private": True, "desc": None}
+        playlist_id = self.call("POST", "/playlists/", 201, json=playlist).json()["id"]
+        self.call("PUT", "/playlists/{id}", 202, id=playlist_id, json=playlist)
+        self.call("GET", "/playlists/{id}", id=playlist_id)
+        self.call("GET", "/playlists/", params={"name": name})
+        self.call(
+            "POST",
+            "/playlist-songs/",
+            201,
+            json={"playlist_id": playlist_id, "song_id": song_ids[0]},
+        )
+        self.call(
+            "POST",
+            "/playlist-songs/{playlist_id}/batch",
+            playlist_id=playlist_id,
+            json={"add": song_ids, "remove": [song_ids[0]]},
+        )
+        self.call(
+            "PUT",
+            "/playlist-songs/{playlist_id}/order",
+            204,
+            playlist_id=playlist_id,
+            json={"song_ids": song_ids[:0:-1]},
+        )
+        self.call("GET", "/playlist-songs/{id}", id=playlist_id)
+        self.call(
+            "DELETE",
+            "/playlist-songs/{playlist_id}/{song_id}",
+            204,
+            playlist_id=playlist_id,
+            song_id=song_ids[1],
+        )
+        self.call("GET", "/search/", params={"q": name})
+        database.settings.admin_emails.append(email)
+        self.call("GET", "/metrics")
+        self.call("GET", "/admin/export/users", params={"format": "csv"})
+        self.call("GET", "/admin/export/playlists")
+        database.settings.admin_emails.remove(email)
+
+        self.call("DELETE", "/playlists/{id}", 204, id=playlist_id)
+        self.call("DELETE", "/songs/{id}", 204, id=song_ids[0])
+        self.call("DELETE", "/artists/{id}", 204, id=artist_id)
+        self.call("DELETE", "/users/{id}", 204, id=self.user_id)
+        # Genres have no delete route
+        with database.SessionLocal() as db:
+            db.query(models.Genre).filter(models.Genre.id == genre_id).delete()
+            db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the statements of each route"
+    )
+    args = parser.parse_args()
+
+    routes = [
+        f"{method} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.path != "/"
+        for method in route.methods
+    ]
+
+    # Background refreshes would be counted against whichever route is running
+    database.settings.trending_refresh_seconds = 0
+    with TestClient(app) as client:
+        scenario = Scenario(client, StatementCounter())
+        scenario.run()
+
+    failed = False
+    for route in routes:
+        budget = BUDGETS.get(route)
+        count = scenario.counts.get(route)
+        if budget is None or count is None:
+            status = "no budget" if budget is None else "not called"
+            failed = True
+        elif count > budget:
+            status = "OVER BUDGET"
+            failed = True
+        else:
+            status = "ok"
+        print(f"{route:48} {count!s:>4} / {budget!s:<4} {status}")
+        if args.verbose:
+            for statement in scenario.statements.get(route, []):
+                print("    " + " ".join(statement.split())[:160])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Shows Postgres query plans for the router queries with and without the
+secondary indexes declared in app/models.py
+
+Run against a seeded database from the repository root:
+
+    python -m benchmarks.query_plans [--analyze]
+
+The "before" plans are taken inside a transaction that drops the indexes
+and is rolled back afterwards, so the schema is left untouched. Dropping an
+index takes an exclusive lock on its table, only run this against a local or
+staging database.
+"""
+import argparse
+from sqlalchemy import text
+from app import models
+from app.database import engine
+
+# (name, SQL issued by the router, bind parameters)
+QUERIES = [
+    (
+        "song.create_song duplicate check",
+        "SELECT id FROM songs WHERE artist_id = :artist_id AND title = :title LIMIT 1",
+        {"artist_id": 1, "title": "title"},
+    ),
+    (
+        "song.get_songs genre page",
+        "SELECT * FROM songs WHERE genre_id = :genre_id AND id > :last_id "
+        "ORDER BY id LIMIT 20",
+        {"genre_id": 1, "last_id": 0},
+    ),
+    (
+        "artist.get_artist songs",
+        "SELECT * FROM songs WHERE artist_id = :artist_id",
+        {"artist_id": 1},
+    ),
+    (
+        "artist.create_artist duplicate check",
+        "SELECT id FROM artists WHERE name = :name LIMIT 1",
+        {"name": "name"},
+    ),
+    (
+        "playlist.create_playlist duplicate check",
+        "SELECT id FROM playlists WHERE name = :name AND created_by = :user_id LIMIT 1",
+        {"name": "name", "user_id": 1},
+    ),
+    (
+        "playlist.get_playlists",
+        "SELECT * FROM playlists WHERE private = false OR created_by = :user_id",
+        {"user_id": 1},
+    ),
+    (
+        "playlist_songs.get_playlist_songs",
+        "SELECT songs.* FROM songs JOIN playlist_songs "
+        "ON songs.id = playlist_songs.song_id WHERE playlist_songs.playlist_id = :id",
+        {"id": 1},
+    ),
+    (
+        "song.delete_song likes cascade",
+        "SELECT 1 FROM likes WHERE song_id = :song_id",
+        {"song_id": 1},
+    ),
+]
+
+
+def explain(connection, sql, params, analyze):
+    prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+    rows = connection.execute(text(prefix + sql), params)
+    return "\n".join(f"    {row[0]}" for row in rows)
+
+
+def model_indexes():
+    return [
+        index.name
+        for table in models.Base.metadata.sorted_tables
+        for index in table.indexes
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--analyze", action="store_true", help="use EXPLAIN ANALYZE")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        before = {}
+        transaction = connection.begin()
+        try:
+            for name in model_indexes():
+                connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            for name, sql, params in QUERIES:
+                before[name] = explain(connection, sql, params, args.analyze)
+        finally:
+            transaction.rollback()
+
+        for name, sql, params in QUERIES:
+            print(f"== {name}")
+            print("  before:")
+            print(before[name])
+            print("  after:")
+            print(explain(connection, sql, params, args.analyze))
+            print()
+
+
+if __name__ == "__main__":
+    main()
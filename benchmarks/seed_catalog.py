@@ -0,0 +1,223 @@
+"""
+Seeds a synthetic catalog for benchmarks.load_test into the database in .env
+
+    python -m benchmarks.seed_catalog [--users 20000] [--artists 5000]
+        [--songs 200000] [--likes 2000000] [--playlists 20000]
+        [--playlist-size 500] [--seed 0.42] [--reset | --delete]
+        [--no-recommendations]
+
+Rows are generated in the database with generate_series under setseed, so the
+same arguments give the same catalog. Likes and playlist songs are skewed
+towards a head of popular songs and users, playlists get 1 to playlist-size
+songs. Every seeded user has an @load.test email and the password in
+PASSWORD. --reset deletes a previous load catalog first, --delete only deletes
+it. Refreshes trending_songs and builds recommendations at the end.
+"""
+import argparse
+import time
+from sqlalchemy import text
+from app import database, recommendations, utils
+
+PASSWORD = "load-test"
+
+# random() ** SKEW picks low indexes far more often, a long tailed popularity
+SONG_SKEW = 3
+USER_SKEW = 2
+
+STEPS = [
+    (
+        "users",
+        """
+        INSERT INTO users (email, password)
+        SELECT 'load-' || i || '@load.test', :password
+        FROM generate_series(0, :users - 1) AS i
+        """,
+    ),
+    (
+        "genres",
+        """
+        INSERT INTO genres (genre)
+        SELECT 'load-genre-' || i FROM generate_series(0, :genres - 1) AS i
+        """,
+    ),
+    (
+        "artists",
+        """
+        WITH seeded AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM users
+            WHERE email LIKE '%@load.test'
+        )
+        INSERT INTO artists (name, created_by)
+        SELECT 'load-artist-' || i,
+               ids[1 + floor(random() * array_length(ids, 1))::int]
+        FROM generate_series(0, :artists - 1) AS i, seeded
+        """,
+    ),
+    (
+        "songs",
+        """
+        WITH artist_ids AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM artists
+            WHERE name LIKE 'load-artist-%'
+        ), genre_ids AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM genres
+            WHERE genre LIKE 'load-genre-%'
+        ), picked AS (
+            SELECT i,
+                   artist_ids.ids[1 + floor(random() * array_length(artist_ids.ids, 1))::int] AS artist_id,
+                   genre_ids.ids[1 + floor(random() * array_length(genre_ids.ids, 1))::int] AS genre_id,
+                   make_interval(secs => 90 + floor(random() * 330)) AS length
+            FROM generate_series(0, :songs - 1) AS i, artist_ids, genre_ids
+        )
+        INSERT INTO songs (title, artist_id, genre_id, length, created_by)
+        SELECT 'load-song-' || picked.i, picked.artist_id, picked.genre_id,
+               '00:00:00'::time + picked.length, artists.created_by
+        FROM picked JOIN artists ON artists.id = picked.artist_id
+        """,
+    ),
+    (
+        "likes",
+        """
+        WITH user_ids AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM users
+            WHERE email LIKE '%@load.test'
+        ), song_ids AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM songs
+            WHERE title LIKE 'load-song-%'
+        )
+        INSERT INTO likes (created_by, song_id, created_at)
+        SELECT user_ids.ids[1 + floor(random() ^ :user_skew * array_length(user_ids.ids, 1))::int],
+               song_ids.ids[1 + floor(random() ^ :song_skew * array_length(song_ids.ids, 1))::int],
+               now() - random() * interval '60 days'
+        FROM generate_series(1, :likes), user_ids, song_ids
+        ON CONFLICT DO NOTHING
+        """,
+    ),
+    (
+        "playlists",
+        """
+        WITH seeded AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM users
+            WHERE email LIKE '%@load.test'
+        )
+        INSERT INTO playlists (name, private, "desc", created_by)
+        SELECT 'load-playlist-' || i, random() < 0.2, NULL,
+               ids[1 + floor(random() ^ :user_skew * array_length(ids, 1))::int]
+        FROM generate_series(0, :playlists - 1) AS i, seeded
+        """,
+    ),
+    (
+        "playlist songs",
+        """
+        WITH song_ids AS (
+            SELECT array_agg(id ORDER BY id) AS ids FROM songs
+            WHERE title LIKE 'load-song-%'
+        ), sized AS (
+            SELECT id, created_by, 1 + floor(random() * :playlist_size)::int AS size
+            FROM playlists WHERE name LIKE 'load-playlist-%'
+        )
+        INSERT INTO playlist_songs (playlist_id, song_id, position, created_by)
+        SELECT sized.id,
+               song_ids.ids[1 + floor(random() ^ :song_skew * array_length(song_ids.ids, 1))::int],
+               position, sized.created_by
+        FROM sized
+        CROSS JOIN LATERAL generate_series(1, sized.size) AS position, song_ids
+        ON CONFLICT (song_id, playlist_id) DO NOTHING
+        """,
+    ),
+]
+
+
+def reset(conn):
+    """Deletes the load catalog, everything else goes with its users by cascade"""
+    conn.execute(text("DELETE FROM users WHERE email LIKE '%@load.test'"))
+    conn.execute(text("DELETE FROM genres WHERE genre LIKE 'load-genre-%'"))
+
+
+def seed(conn, sizes: dict, seed: float):
+    conn.execute(text("SELECT setseed(:seed)"), {"seed": seed})
+    params = {
+        **sizes,
+        "password": utils.hash(PASSWORD),
+        "song_skew": SONG_SKEW,
+        "user_skew": USER_SKEW,
+    }
+    # One UPDATE per like through the like_count trigger, counted once instead
+    conn.execute(text("ALTER TABLE likes DISABLE TRIGGER likes_like_count"))
+    for name, statement in STEPS:
+        started = time.perf_counter()
+        count = conn.execute(text(statement), params).rowcount
+        print(f"{name:15} {count:10} rows {time.perf_counter() - started:8.1f}s")
+    conn.execute(text("ALTER TABLE likes ENABLE TRIGGER likes_like_count"))
+    conn.execute(
+        text(
+            """
+            UPDATE songs SET like_count = counts.likes
+            FROM (SELECT song_id, count(*) AS likes FROM likes GROUP BY song_id) AS counts
+            WHERE songs.id = counts.song_id AND songs.title LIKE 'load-song-%'
+            """
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--artists", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=50)
+    parser.add_argument("--songs", type=int, default=200000)
+    parser.add_argument("--likes", type=int, default=2000000)
+    parser.add_argument("--playlists", type=int, default=20000)
+    parser.add_argument("--playlist-size", type=int, default=500)
+    parser.add_argument("--seed", type=float, default=0.42, help="setseed, -1 to 1")
+    parser.add_argument(
+        "--reset", action="store_true", help="delete the load catalog first"
+    )
+    parser.add_argument(
+        "--delete", action="store_true", help="only delete the load catalog"
+    )
+    parser.add_argument(
+        "--no-recommendations",
+        action="store_true",
+        help="leave song_neighbors to python -m app.cli build-recommendations",
+    )
+    args = parser.parse_args()
+
+    with database.engine.begin() as conn:
+        if args.reset or args.delete:
+            reset(conn)
+        if args.delete:
+            return
+        seed(
+            conn,
+            {
+                "users": args.users,
+                "artists": args.artists,
+                "genres": args.genres,
+                "songs": args.songs,
+                "likes": args.likes,
+                "playlists": args.playlists,
+                "playlist_size": args.playlist_size,
+            },
+            args.seed,
+        )
+    with database.engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+            text(
+                "ANALYZE users, artists, genres, songs, likes, playlists, playlist_songs"
+            )
+        )
+
+    with database.SessionLocal() as db:
+        db.execute(text("REFRESH MATERIALIZED VIEW trending_songs"))
+        db.execute(text("UPDATE trending_refresh SET refreshed_at = now()"))
+        db.commit()
+        if args.no_recommendations:
+            return
+        started = time.perf_counter()
+        built = recommendations.build(db, full=True)
+        print(f"recommendations {built} {time.perf_counter() - started:8.1f}s")
+
+
+if __name__ == "__main__":
+    main()
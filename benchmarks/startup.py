@@ -0,0 +1,204 @@
+"""
+Import time of the app and time from launch to first request of cold servers
+
+    python -m benchmarks.startup [--runs 5] [--top 15] [--workers 4] [--output startup.json]
+
+Imports app.main in fresh interpreters under python -X importtime and lists the
+modules and top level packages with the most import time (median over runs).
+Then launches uvicorn with one worker and gunicorn (gunicorn.conf.py) with
+workers, with and without preload_app, against the database in .env, timing
+from launch to the first answer of GET /, of the database read GET /genres/
+and, for gunicorn, until every worker finished the app startup.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+import requests
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+STARTUP_COMPLETE = "Application startup complete"
+
+
+def import_times(runs: int):
+    """Median (total, self time per module, self time per package) in seconds"""
+    totals, modules, packages = [], defaultdict(list), defaultdict(list)
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app.main"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        per_package = defaultdict(float)
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, _, module = match.groups()
+            modules[module].append(int(self_us) / 1e6)
+            per_package[module.split(".")[0]] += int(self_us) / 1e6
+            if module == "app.main":
+                totals.append(int(cumulative_us) / 1e6)
+        for package, seconds in per_package.items():
+            packages[package].append(seconds)
+    median = lambda times: statistics.median(times + [0] * (runs - len(times)))
+    return (
+        statistics.median(totals),
+        {module: median(times) for module, times in modules.items()},
+        {package: median(times) for package, times in packages.items()},
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, started: float, timeout: float = 60) -> float:
+    """Seconds from started until url answers 200"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(url, timeout=timeout).status_code == 200:
+                return time.perf_counter() - started
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.005)
+    raise SystemExit(f"{url} did not answer in {timeout}s")
+
+
+def time_server(command: list, env: dict, port: int, workers: int) -> dict:
+    ready = []
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        command,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    def read_log():
+        for line in server.stderr:
+            if STARTUP_COMPLETE in line:
+                ready.append(time.perf_counter() - started)
+
+    reader = threading.Thread(target=read_log, daemon=True)
+    reader.start()
+    try:
+        url = f"http://127.0.0.1:{port}"
+        result = {
+            "first_response_s": wait_for(url + "/", started),
+            "first_db_response_s": wait_for(url + "/genres/", started),
+        }
+        deadline = time.perf_counter() + 60
+        while len(ready) < workers and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        result["all_workers_ready_s"] = max(ready) if len(ready) == workers else None
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def servers(workers: int, runs: int) -> dict:
+    configurations = {
+        "uvicorn": (
+            lambda port: [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--port",
+                str(port),
+            ],
+            {},
+            1,
+        ),
+    }
+    for preload in ("true", "false"):
+        configurations[f"gunicorn preload_app={preload}"] = (
+            lambda port: [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "app.main:app",
+                "--config",
+                "gunicorn.conf.py",
+                "--bind",
+                f"127.0.0.1:{port}",
+                "--workers",
+                str(workers),
+                "--log-level",
+                "info",
+            ],
+            {"PRELOAD_APP": preload},
+            workers,
+        )
+
+    results = {}
+    for name, (command, env, worker_count) in configurations.items():
+        timings = []
+        for _ in range(runs):
+            port = free_port()
+            timings.append(time_server(command(port), env, port, worker_count))
+        results[name] = {
+            key: (
+                None
+                if None in (values := [timing[key] for timing in timings])
+                else round(statistics.median(values), 3)
+            )
+            for key in timings[0]
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    total, modules, packages = import_times(args.runs)
+    slowest = lambda times: dict(
+        sorted(times.items(), key=lambda item: -item[1])[: args.top]
+    )
+    report = {
+        "import_app_s": round(total, 3),
+        "packages_s": {k: round(v, 4) for k, v in slowest(packages).items()},
+        "modules_s": {k: round(v, 4) for k, v in slowest(modules).items()},
+        "servers": servers(args.workers, args.runs),
+    }
+
+    print(f"import app.main {total * 1000:8.1f}ms")
+    for title, times in (("package", "packages_s"), ("module", "modules_s")):
+        print(f"\nslowest by {title} (self time)")
+        for name, seconds in report[times].items():
+            print(f"    {name:48} {seconds * 1000:8.1f}ms")
+    print(f"\n{'server':32} {'first /':>10} {'first db':>10} {'all ready':>10}")
+    for name, timing in report["servers"].items():
+        print(
+            f"{name:32}"
+            + "".join(
+                f" {'-' if value is None else f'{value * 1000:.0f}ms':>10}"
+                for value in timing.values()
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+gunicorn settings for running the API with uvicorn workers
+
+    gunicorn app.main:app
+
+With preload_app the master imports app.main once and forks the workers from
+it, so they start without importing or building the routes again and share
+those pages. Each worker then runs the app startup, which creates its own
+database engines, see database.init_engines. PRELOAD_APP=false imports the
+app in every worker instead, e.g. to pick up code changes on a HUP.
+
+Run more than one worker with CACHE_BACKEND=redis, with the memory backend a
+write only invalidates the cached responses of the worker that handled it.
+LIKE_WRITE_BEHIND is for a single worker, see like_write_behind in config.py.
+
+Workers write their Prometheus metrics to files in PROMETHEUS_MULTIPROC_DIR, a
+new temporary directory unless set, and the master serves the sum of them on
+METRICS_PORT, see metrics.registry.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# Read when prometheus_client is imported, before the app is loaded
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="music-library-metrics-")
+)
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() == "true"
+
+
+def on_starting(server):
+    from app import like_buffer, response_cache
+
+    response_cache.warn_if_per_worker(server.cfg.workers)
+    like_buffer.warn_if_per_worker(server.cfg.workers)
+    # Metrics of a previous run in a reused directory
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def when_ready(server):
+    from app import metrics
+
+    metrics.start_server()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)